@@ -8,30 +8,124 @@ from flask_jwt_extended import (
     get_jwt,
 )
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL, event, func, inspect, literal_column, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 import os
+import re
+import gzip
+import hashlib
+import tempfile
+import threading
+import time
 import uuid
-from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from PIL import Image, ImageOps, features
 import io
 import base64
+import binascii
+import bisect
+import json
 import yaml
 from email_validator import validate_email, EmailNotValidError
+from email_validator import EmailUndeliverableError
+from email_validator.deliverability import validate_email_deliverability
+import dns.resolver
+
+try:
+    import brotli
+except ImportError:  # optional: only adds a br variant for /openapi.*
+    brotli = None
+
+try:
+    from PIL import ImageCms
+except ImportError:  # optional: without it, ICC-tagged uploads keep raw values
+    ImageCms = None
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "your-secret-key-change-in-production"
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///mentor_mentee.db"
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+    "SQLALCHEMY_DATABASE_URI", "sqlite:///mentor_mentee.db"
+)
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["JWT_SECRET_KEY"] = "jwt-secret-key-change-in-production"
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
-app.config["UPLOAD_FOLDER"] = "uploads"
+# Trust the role claim in access tokens instead of loading the user row on
+# every request. Turn off to re-read roles from the database each time.
+app.config["AUTHORIZE_FROM_CLAIMS"] = True
+# Profile images are stored once per distinct content, in files named by
+# their SHA-256 under UPLOAD_FOLDER. To let a front proxy send them instead of
+# the app, set USE_X_SENDFILE (Apache, lighttpd) or IMAGE_ACCEL_REDIRECT to
+# an nginx internal location aliased to UPLOAD_FOLDER. The store holds the
+# only copy of each image, so it lives next to the app rather than under
+# whatever directory the server or a CLI command happens to start in.
+app.config["UPLOAD_FOLDER"] = os.path.join(app.root_path, "uploads")
+app.config["IMAGE_ACCEL_REDIRECT"] = None  # e.g. "/protected-images/"
+# imageUrl fields carry ?v=<content hash prefix>; such URLs never change
+# content, so responses to them may be cached this long (one year)
+app.config["IMAGE_CACHE_MAX_AGE"] = 365 * 24 * 3600
+# Uploads are decoded once and re-encoded without metadata as a progressive
+# JPEG, plus a WebP copy for clients that send it in Accept
+app.config["IMAGE_JPEG_QUALITY"] = 85
+app.config["IMAGE_WEBP"] = features.check("webp")
+app.config["IMAGE_WEBP_QUALITY"] = 80
+# ?size= thumbnails are made on first request in a process pool and kept in
+# an LRU under UPLOAD_FOLDER/thumbnails. A request waits up to
+# THUMBNAIL_TIMEOUT seconds for its thumbnail, then gets the full image.
+app.config["THUMBNAIL_SIZES"] = (64, 128, 256)
+app.config["THUMBNAIL_QUALITY"] = 85
+app.config["THUMBNAIL_WORKERS"] = os.cpu_count() or 1
+app.config["THUMBNAIL_TIMEOUT"] = 5  # seconds
+app.config["THUMBNAIL_CACHE_MAX_BYTES"] = 64 * 1024 * 1024
 app.config["MAX_CONTENT_LENGTH"] = 1 * 1024 * 1024  # 1MB max file size
+# Profile image limits, checked before any pixel data is decoded
+app.config["IMAGE_MAX_BYTES"] = 1 * 1024 * 1024
+app.config["IMAGE_MAX_PIXELS"] = 1000 * 1000
+app.config["MAX_PAGE_SIZE"] = 100  # upper bound for ?limit= on list routes
+# Password hashing runs on a dedicated pool. "thread" suits werkzeug's
+# scrypt/pbkdf2 (hashlib releases the GIL); "process" sidesteps the GIL for
+# backends that hold it. Jobs beyond workers + queue size get a 503.
+# The method defaults to werkzeug's own, so existing hashes stay as they are;
+# logins rehash to whatever method is configured here.
+app.config["PASSWORD_HASH_METHOD"] = "pbkdf2"
+app.config["PASSWORD_HASH_EXECUTOR"] = "thread"  # 'thread' or 'process'
+app.config["PASSWORD_HASH_WORKERS"] = os.cpu_count() or 1
+app.config["PASSWORD_HASH_QUEUE_SIZE"] = 32
+# Signup validates email syntax offline. Domain deliverability (DNS) checks
+# are "off", "async" (checked in the background, rejected once known bad) or
+# "sync" (checked before responding); results are cached per domain.
+app.config["EMAIL_DELIVERABILITY_CHECK"] = "off"
+app.config["EMAIL_DOMAIN_CACHE_TTL"] = 3600  # seconds
+app.config["EMAIL_DOMAIN_CACHE_SIZE"] = 10000
+app.config["EMAIL_DNS_TIMEOUT"] = 5  # seconds
+# GET /api/mentors response cache (per process)
+app.config["MENTOR_CACHE_MAX_ENTRIES"] = 512
+app.config["MENTOR_CACHE_MAX_BYTES"] = 32 * 1024 * 1024
+app.config["OPENAPI_SPEC_PATH"] = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "openapi.yaml"
+)
 
 # Initialize extensions
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
-CORS(app, origins=["http://localhost:3000", "http://localhost:3001"], supports_credentials=True)
+CORS(
+    app,
+    origins=["http://localhost:3000", "http://localhost:3001"],
+    supports_credentials=True,
+    expose_headers=["X-Next-Cursor"],
+)
 
 # Create upload directory
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
@@ -45,12 +139,20 @@ class User(db.Model):
     role = db.Column(db.String(10), nullable=False)  # 'mentor' or 'mentee'
     name = db.Column(db.String(100), nullable=True)
     bio = db.Column(db.Text, nullable=True)
-    profile_image = db.Column(db.LargeBinary, nullable=True)
+    # Denormalized ORDER BY key for sortBy=skill, see mentor_skills_key()
+    skills_sort_key = db.Column(db.Text, nullable=False, default="", server_default="")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
     mentor_skills = db.relationship(
-        "MentorSkill", backref="user", lazy=True, cascade="all, delete-orphan"
+        "MentorSkill",
+        backref="user",
+        lazy=True,
+        cascade="all, delete-orphan",
+        order_by="MentorSkill.id",  # the order the mentor listed them in
+    )
+    profile_image = db.relationship(
+        "ProfileImage", uselist=False, lazy=True, cascade="all, delete-orphan"
     )
     sent_requests = db.relationship(
         "MatchingRequest",
@@ -66,10 +168,59 @@ class User(db.Model):
     )
 
 
+class Skill(db.Model):
+    # One row per distinct skill, matched case- and whitespace-insensitively;
+    # name keeps the first spelling seen for display
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    normalized_name = db.Column(db.String(50), nullable=False, unique=True, index=True)
+    # Maintained by set_mentor_skills(); reconcile_skill_counts() rebuilds it
+    mentor_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+
 class MentorSkill(db.Model):
+    # The unique (user_id, skill_id) index also serves lookups by user_id
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "skill_id", name="uq_mentor_skill_user_skill"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    skill = db.Column(db.String(50), nullable=False)
+    skill_id = db.Column(db.Integer, db.ForeignKey("skill.id"), nullable=False)
+
+    skill = db.relationship("Skill", lazy="joined")
+
+
+class ProfileImage(db.Model):
+    # The bytes live in the image store (see store_image()); only their
+    # SHA-256, which names the file, is kept here
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False)
+    content_type = db.Column(
+        db.String(20), nullable=False, default="image/jpeg", server_default="image/jpeg"
+    )
+    # The same image as WebP, when one was made at upload
+    webp_sha256 = db.Column(db.String(64), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Keeps deep pages of the mentor directory (sorted by name) on an index. The
+# expression must match mentor_name_sort_key() exactly for SQLite to use it.
+db.Index("ix_user_role_name", User.role, text("coalesce(name, '')"), User.id)
+db.Index("ix_user_role_skills", User.role, User.skills_sort_key, User.id)
+# Covers the skill filter: skill ids -> mentor ids without touching rows
+db.Index("ix_mentor_skill_skill_user", MentorSkill.skill_id, MentorSkill.user_id)
+
+
+# Full-text index over mentor skills and bios (rowid = user id), used by the
+# skill filter and q= search on /api/mentors. SQLAlchemy has no model for
+# FTS5 virtual tables, so it is created and dropped alongside the metadata.
+MENTOR_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS mentor_search "
+    "USING fts5(skills, bio, prefix='2 3')"
+)
+event.listen(db.metadata, "after_create", DDL(MENTOR_SEARCH_DDL))
+event.listen(db.metadata, "before_drop", DDL("DROP TABLE IF EXISTS mentor_search"))
 
 
 class MatchingRequest(db.Model):
@@ -83,6 +234,41 @@ class MatchingRequest(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Request feeds for a mentee / mentor, newest first, optionally by
+        # status (the implicit rowid breaks created_at ties)
+        db.Index(
+            "ix_matching_request_mentee_feed", "mentee_id", "status", "created_at"
+        ),
+        db.Index(
+            "ix_matching_request_mentor_feed", "mentor_id", "status", "created_at"
+        ),
+        db.Index("ix_matching_request_mentee_created", "mentee_id", "created_at"),
+        db.Index("ix_matching_request_mentor_created", "mentor_id", "created_at"),
+        # A mentee asks each mentor at most once, has at most one pending
+        # request, and a mentor has at most one accepted mentee. Enforced here
+        # rather than by checking first, so concurrent requests can't both get
+        # through.
+        db.Index(
+            "uq_matching_request_mentor_mentee", "mentor_id", "mentee_id", unique=True
+        ),
+        db.Index(
+            "uq_matching_request_pending_mentee",
+            "mentee_id",
+            unique=True,
+            sqlite_where=db.text("status = 'pending'"),
+        ),
+        db.Index(
+            "uq_matching_request_accepted_mentor",
+            "mentor_id",
+            unique=True,
+            sqlite_where=db.text("status = 'accepted'"),
+        ),
+    )
+
+
+MATCH_REQUEST_STATUSES = {"pending", "accepted", "rejected", "cancelled"}
+
 
 # Utility functions
 def validate_image(file):
@@ -98,24 +284,999 @@ def validate_image(file):
     ):
         return False, "Only JPG and PNG files are allowed"
 
-    try:
-        # Check image dimensions and size
-        image = Image.open(file.stream)
-        width, height = image.size
-
-        if width < 500 or height < 500 or width > 1000 or height > 1000:
-            return False, "Image must be between 500x500 and 1000x1000 pixels"
-
-        if width != height:
-            return False, "Image must be square"
+    # Check the size before reading anything
+    file.stream.seek(0, os.SEEK_END)
+    too_large = file.stream.tell() > app.config["IMAGE_MAX_BYTES"]
+    file.stream.seek(0)
+    if too_large:
+        return False, "Image size must be less than 1MB"
 
-        # Reset stream position
-        file.stream.seek(0)
+    try:
+        error = image_error(file.stream)
+        if error:
+            return False, error
         return True, "Valid image"
     except Exception as e:
         return False, f"Invalid image file: {str(e)}"
 
 
+def image_error(stream):
+    """Check an image's format and dimensions; returns an error message or None
+
+    Pillow's lazy open parses only the header, so no pixel data is decoded
+    and a small file claiming huge dimensions (a decompression bomb) costs
+    next to nothing. Leaves the stream at its start.
+    """
+    dimensions_error = "Image must be between 500x500 and 1000x1000 pixels"
+    try:
+        with Image.open(stream, formats=["JPEG", "PNG"]) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        return dimensions_error  # far past Pillow's own pixel limit
+    finally:
+        stream.seek(0)
+
+    if width < 500 or height < 500 or width > 1000 or height > 1000:
+        return dimensions_error
+    if width != height:
+        return "Image must be square"
+    return None
+
+
+def base64_decoded_size(encoded):
+    """Bytes that base64 text decodes to, at most, worked out from its length"""
+    return len(encoded) * 3 // 4 - encoded[-2:].count("=")
+
+
+def index_mentor_for_search(user, skills):
+    """Refresh a mentor's row in the mentor_search full-text index"""
+    db.session.execute(
+        text("DELETE FROM mentor_search WHERE rowid = :user_id"),
+        {"user_id": user.id},
+    )
+    if user.role == "mentor":
+        db.session.execute(
+            text(
+                "INSERT INTO mentor_search (rowid, skills, bio) "
+                "VALUES (:user_id, :skills, :bio)"
+            ),
+            {"user_id": user.id, "skills": "\n".join(skills), "bio": user.bio or ""},
+        )
+
+
+def normalize_skill(name):
+    """Canonical form of a skill name: whitespace collapsed, lowercased"""
+    return " ".join(name.split()).lower()
+
+
+def mentor_skills_key(skills):
+    """Sort key for a skill list: normalized names joined in order"""
+    return ", ".join(normalize_skill(skill) for skill in skills)
+
+
+def resolve_skills(names):
+    """Return the Skill rows for names in order, creating any that are new
+
+    Names that normalize to the same skill (or to nothing) are dropped.
+    """
+    wanted = {}
+    for name in names:
+        normalized = normalize_skill(name)
+        if normalized and normalized not in wanted:
+            wanted[normalized] = " ".join(name.split())
+    if not wanted:
+        return []
+
+    skills = Skill.query.filter(Skill.normalized_name.in_(wanted))
+    by_name = {skill.normalized_name: skill for skill in skills}
+    missing = [normalized for normalized in wanted if normalized not in by_name]
+    if missing:
+        # A concurrent request may add the same skill first; the unique
+        # index on normalized_name makes both end up with the same row
+        db.session.execute(
+            sqlite_insert(Skill)
+            .values(
+                [
+                    {"name": wanted[normalized], "normalized_name": normalized}
+                    for normalized in missing
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["normalized_name"])
+        )
+        skills = Skill.query.filter(Skill.normalized_name.in_(missing))
+        by_name.update((skill.normalized_name, skill) for skill in skills)
+    return [by_name[normalized] for normalized in wanted]
+
+
+def matching_skill_ids(terms):
+    """Ids of skills with a word starting with the normalized terms
+
+    "pyth" matches Python, "django" matches "Python Django" and "react nat"
+    matches "React Native".
+    """
+    normalized = normalize_skill(terms)
+    if not normalized:
+        return []
+    pattern = re.sub(r"([\\%_])", r"\\\1", normalized)
+    return [
+        skill_id
+        for (skill_id,) in db.session.query(Skill.id).filter(
+            Skill.normalized_name.like(f"{pattern}%", escape="\\")
+            | Skill.normalized_name.like(f"% {pattern}%", escape="\\")
+        )
+    ]
+
+
+def set_mentor_skills(user, names):
+    """Replace a mentor's skills and refresh everything derived from them
+
+    Only the rows that differ are written. Returns False, having written
+    nothing, if the skill list is unchanged.
+    """
+    skills = resolve_skills(names)
+    new_ids = [skill.id for skill in skills]
+    rows = (
+        db.session.query(MentorSkill.id, MentorSkill.skill_id)
+        .filter_by(user_id=user.id)
+        .order_by(MentorSkill.id)
+        .all()
+    )
+    if [skill_id for _, skill_id in rows] == new_ids:
+        return False
+
+    # Skills keep the order they were listed in (rows are read back by id),
+    # so kept rows stay only up to the first position where the order
+    # differs; everything after that is rewritten
+    removed = {skill_id for _, skill_id in rows} - set(new_ids)
+    kept = [(row_id, skill_id) for row_id, skill_id in rows if skill_id not in removed]
+    position = 0
+    while position < len(kept) and kept[position][1] == new_ids[position]:
+        position += 1
+    stale_rows = [row_id for row_id, skill_id in rows if skill_id in removed]
+    stale_rows += [row_id for row_id, _ in kept[position:]]
+
+    if stale_rows:
+        db.session.execute(
+            db.delete(MentorSkill).where(MentorSkill.id.in_(stale_rows))
+        )
+    if new_ids[position:]:
+        db.session.execute(
+            db.insert(MentorSkill),
+            [
+                {"user_id": user.id, "skill_id": skill_id}
+                for skill_id in new_ids[position:]
+            ],
+        )
+
+    # Only skills gained or lost change their mentor counts
+    added = set(new_ids) - {skill_id for _, skill_id in rows}
+    for skill_ids, delta in ((added, 1), (removed, -1)):
+        if skill_ids:
+            db.session.execute(
+                db.update(Skill)
+                .where(Skill.id.in_(skill_ids))
+                .values(mentor_count=Skill.mentor_count + delta)
+            )
+
+    names = [skill.name for skill in skills]
+    user.skills_sort_key = mentor_skills_key(names)
+    index_mentor_for_search(user, names)
+
+    # Applied to skill_index once the transaction commits
+    updates = db.session.info.setdefault("skill_index_updates", {})
+    updates[user.id] = [(skill.id, skill.name) for skill in skills]
+    return True
+
+
+def update_profile_fields(user, data):
+    """Apply name, bio and (for mentors) skills from a profile update
+
+    Returns True if any of them actually changed.
+    """
+    name_changed = "name" in data and data["name"] != user.name
+    bio_changed = "bio" in data and data["bio"] != user.bio
+    if name_changed:
+        user.name = data["name"]
+    if bio_changed:
+        user.bio = data["bio"]
+
+    if user.role != "mentor":
+        return name_changed or bio_changed
+    if "skills" in data and set_mentor_skills(user, data["skills"] or []):
+        return True  # the search index was refreshed with the new bio too
+    if bio_changed:
+        index_mentor_for_search(user, [s.skill.name for s in user.mentor_skills])
+    return name_changed or bio_changed
+
+
+_SKILL_MENTORS_SQL = (
+    "(SELECT count(*) FROM mentor_skill WHERE mentor_skill.skill_id = skill.id)"
+)
+RECONCILE_SKILL_COUNTS_SQL = (
+    f"UPDATE skill SET mentor_count = {_SKILL_MENTORS_SQL} "
+    f"WHERE mentor_count != {_SKILL_MENTORS_SQL}"
+)
+
+
+def reconcile_skill_counts():
+    """Recount every skill's mentors from mentor_skill
+
+    The counts are kept up to date incrementally; this repairs any drift
+    (e.g. from rows edited by hand). Returns the number of skills fixed.
+    """
+    fixed = db.session.execute(text(RECONCILE_SKILL_COUNTS_SQL)).rowcount
+    db.session.commit()
+    return fixed
+
+
+def skill_facets():
+    """Every skill some mentor has, with its mentor count, most common first"""
+    skills = (
+        db.session.query(Skill.name, Skill.mentor_count)
+        .filter(Skill.mentor_count > 0)
+        .order_by(Skill.mentor_count.desc(), Skill.name)
+    )
+    return [{"name": name, "mentors": count} for name, count in skills]
+
+
+class SkillIndex:
+    """In-memory inverted index from skill id to the set of mentor ids
+
+    AND/OR across skills are set intersections and unions, so lookups cost
+    in proportion to the mentors involved, however large or sparse the ids
+    are. A sorted list of skill-name prefixes with per-skill mentor counts
+    backs autocomplete. Loaded from
+    mentor_skill on first use and then updated per mentor as skill changes
+    commit. Each process keeps its own copy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._clear()
+
+    def _clear(self):
+        self._mentors = {}  # skill id -> set of mentor ids
+        self._names = {}  # skill id -> display name
+        self._prefixes = []  # sorted (name from a word start, skill id)
+        self._mentor_skills = {}  # mentor id -> skill ids
+
+    def _ensure_loaded(self):
+        # Caller holds the lock. Commits that land during the load wait for
+        # the lock and are applied afterwards; updates replace a mentor's
+        # whole skill list, so re-applying one is harmless.
+        if self._loaded:
+            return
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                db.select(MentorSkill.user_id, Skill.id, Skill.name)
+                .join(Skill, Skill.id == MentorSkill.skill_id)
+                .order_by(MentorSkill.id)
+            ).all()
+        for user_id, skill_id, name in rows:
+            self._add(user_id, skill_id, name)
+        self._loaded = True
+
+    def _add(self, user_id, skill_id, name):
+        if skill_id not in self._names:
+            self._names[skill_id] = name
+            normalized = normalize_skill(name)
+            for start, char in enumerate(" " + normalized):
+                if char == " ":
+                    bisect.insort(self._prefixes, (normalized[start:], skill_id))
+        self._mentors.setdefault(skill_id, set()).add(user_id)
+        self._mentor_skills.setdefault(user_id, []).append(skill_id)
+
+    def load(self):
+        """Build the index now rather than on the first lookup"""
+        with self._lock:
+            self._ensure_loaded()
+
+    def update(self, user_id, skills):
+        """Replace one mentor's skills, given as (skill id, name) pairs"""
+        with self._lock:
+            if not self._loaded:
+                return
+            for skill_id in self._mentor_skills.pop(user_id, []):
+                self._mentors[skill_id].discard(user_id)
+            for skill_id, name in skills:
+                self._add(user_id, skill_id, name)
+
+    def reset(self):
+        """Forget everything; the next lookup reloads from the database"""
+        with self._lock:
+            self._loaded = False
+            self._clear()
+
+    def mentors(self, skill_id_groups, match_all):
+        """Ids of mentors with a skill from every group (or from any group)
+
+        Each group holds the skill ids one search term resolved to.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            groups = []
+            for skill_ids in skill_id_groups:
+                members = [self._mentors.get(skill_id, set()) for skill_id in skill_ids]
+                if len(members) == 1:
+                    groups.append(members[0])
+                else:
+                    groups.append(set().union(*members))
+
+            # Both operations return new sets, safe to use after the lock
+            if not groups:
+                combined = set()
+            elif match_all:
+                groups.sort(key=len)  # intersect starting from the smallest
+                combined = groups[0].intersection(*groups[1:])
+            else:
+                combined = set().union(*groups)
+
+        return sorted(combined)
+
+    def suggest(self, text, limit):
+        """Skills with a word starting with text, most mentors first
+
+        Returns a list of (name, mentor count).
+        """
+        prefix = normalize_skill(text)
+        if not prefix:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            matches = {}
+            position = bisect.bisect_left(self._prefixes, (prefix,))
+            while position < len(self._prefixes):
+                key, skill_id = self._prefixes[position]
+                if not key.startswith(prefix):
+                    break
+                count = len(self._mentors.get(skill_id, ()))
+                if count > 0:
+                    matches[skill_id] = (self._names[skill_id], count)
+                position += 1
+
+        ranked = sorted(matches.values(), key=lambda match: (-match[1], match[0]))
+        return ranked[:limit]
+
+
+skill_index = SkillIndex()
+
+
+@event.listens_for(db.session, "after_commit")
+def _apply_skill_index_updates(session):
+    for user_id, skill_ids in session.info.pop("skill_index_updates", {}).items():
+        skill_index.update(user_id, skill_ids)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_skill_index_updates(session):
+    session.info.pop("skill_index_updates", None)
+
+
+def build_search_query(terms):
+    """Turn free text into an FTS5 query matching every term as a prefix
+
+    Each word is quoted so user input can never be parsed as FTS5 syntax.
+    Returns None if the text contains no searchable words.
+    """
+    words = re.findall(r"\w+", terms)
+    if not words:
+        return None
+    return " ".join('"{}"*'.format(word) for word in words)
+
+
+class ResponseCache:
+    """Versioned LRU cache of serialized responses
+
+    invalidate() bumps the version, so results computed from data read
+    before the bump are never stored. Concurrent misses for the same key
+    wait for a single computation instead of all hitting the database.
+    """
+
+    def __init__(self, max_entries_key, max_bytes_key):
+        self.max_entries_key = max_entries_key
+        self.max_bytes_key = max_bytes_key
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._size = 0
+        self._in_flight = {}  # key -> (event, outcome)
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Return (value, hit); compute() must return (bytes, extra)"""
+        with self._lock:
+            version = self.version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0], True
+
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = (threading.Event(), {})
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        event, outcome = flight
+        if not leader:
+            event.wait()
+            if "error" in outcome:
+                raise outcome["error"]
+            return outcome["value"], True
+
+        try:
+            outcome["value"] = compute()
+        except Exception as e:
+            outcome["error"] = e
+            raise
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+                if "value" in outcome and self.version == version:
+                    self._store(key, outcome["value"])
+            event.set()
+        return outcome["value"], False
+
+    def _store(self, key, value):
+        size = len(value[0])
+        if size > app.config[self.max_bytes_key]:
+            return
+        self._entries[key] = (value, size)
+        self._size += size
+        while (
+            len(self._entries) > app.config[self.max_entries_key]
+            or self._size > app.config[self.max_bytes_key]
+        ):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+
+    def invalidate(self):
+        """Drop every entry, including any being computed right now"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._in_flight.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+mentor_directory_cache = ResponseCache(
+    "MENTOR_CACHE_MAX_ENTRIES", "MENTOR_CACHE_MAX_BYTES"
+)
+
+
+def mentor_name_sort_key():
+    """SQL sort key for mentor names (matches ix_user_role_name)"""
+    return func.coalesce(User.name, literal_column("''"))
+
+
+def parse_page_size():
+    """Read ?limit= from the request; None means no limit"""
+    limit = request.args.get("limit")
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= app.config["MAX_PAGE_SIZE"]:
+        raise ValueError(f"limit must be between 1 and {app.config['MAX_PAGE_SIZE']}")
+    return limit
+
+
+def encode_cursor(values):
+    """Pack keyset pagination values into an opaque URL-safe token"""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Unpack a token made by encode_cursor; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def apply_keyset(query, sort_key, id_column, descending, cursor_values):
+    """Order by (sort_key, id) and resume after the row in cursor_values"""
+    if descending:
+        query = query.order_by(sort_key.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_key.asc(), id_column.asc())
+
+    if cursor_values is not None:
+        # (key, id) > (last_key, last_id), spelled so that the leading
+        # "key >= last_key" term can seek into an index on the sort key
+        last_key, last_id = cursor_values
+        if descending:
+            query = query.filter(
+                sort_key <= last_key,
+                db.or_(sort_key < last_key, id_column < last_id),
+            )
+        else:
+            query = query.filter(
+                sort_key >= last_key,
+                db.or_(sort_key > last_key, id_column > last_id),
+            )
+    return query
+
+
+def match_request_page(query):
+    """Apply ?status=, ?limit= and ?cursor= to a matching-request query
+
+    Requests come back newest first. Returns (requests, next_cursor) and
+    raises ValueError for invalid parameters.
+    """
+    statuses = request.args.get("status")
+    if statuses:
+        statuses = statuses.split(",")
+        if not set(statuses) <= MATCH_REQUEST_STATUSES:
+            raise ValueError(
+                "status must be one of: " + ", ".join(sorted(MATCH_REQUEST_STATUSES))
+            )
+        query = query.filter(MatchingRequest.status.in_(statuses))
+
+    limit = parse_page_size()
+
+    cursor_values = None
+    if request.args.get("cursor"):
+        cursor_values = decode_cursor(request.args["cursor"])
+        try:
+            created_at, request_id = cursor_values
+            cursor_values = [datetime.fromisoformat(created_at), int(request_id)]
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+
+    query = apply_keyset(
+        query, MatchingRequest.created_at, MatchingRequest.id, True, cursor_values
+    )
+    if limit is not None:
+        query = query.limit(limit + 1)
+    requests = query.all()
+
+    next_cursor = None
+    if limit is not None and len(requests) > limit:
+        requests = requests[:limit]
+        last = requests[-1]
+        next_cursor = encode_cursor([last.created_at.isoformat(), last.id])
+    return requests, next_cursor
+
+
+def insert_match_request(mentor_id, mentee_id, message):
+    """Create a pending request in a single INSERT guarded on the mentor
+
+    Returns the new row, or None if mentor_id isn't a mentor. Raises
+    IntegrityError if the mentee already has a pending request or has
+    already asked this mentor.
+    """
+    now = datetime.utcnow()
+    mentor_exists = db.exists().where(User.id == mentor_id, User.role == "mentor")
+    values = db.select(
+        db.literal(mentor_id),
+        db.literal(mentee_id),
+        db.literal(message),
+        db.literal("pending"),
+        db.literal(now),
+        db.literal(now),
+    ).where(mentor_exists)
+    insert = db.insert(MatchingRequest).from_select(
+        ["mentor_id", "mentee_id", "message", "status", "created_at", "updated_at"],
+        values,
+    )
+    return db.session.execute(
+        insert.returning(
+            MatchingRequest.id,
+            MatchingRequest.mentor_id,
+            MatchingRequest.mentee_id,
+            MatchingRequest.message,
+            MatchingRequest.status,
+        )
+    ).first()
+
+
+def request_creation_failure(mentee_id):
+    """Error response for an insert_match_request() that hit a unique index"""
+    db.session.rollback()
+    pending = db.session.query(
+        MatchingRequest.query.filter_by(mentee_id=mentee_id, status="pending").exists()
+    ).scalar()
+    if pending:
+        return jsonify({"error": "You already have a pending request"}), 400
+    return jsonify({"error": "Request to this mentor already exists"}), 400
+
+
+def set_request_status(request_id, mentor_id, status):
+    """Set the status of one of a mentor's requests in a single UPDATE
+
+    Returns the updated row, or None if mentor_id has no such request (or,
+    when accepting, it is already accepted). Raises IntegrityError if the
+    change would give the mentor a second accepted request.
+    """
+    update = db.update(MatchingRequest).where(
+        MatchingRequest.id == request_id, MatchingRequest.mentor_id == mentor_id
+    )
+    if status == "accepted":
+        update = update.where(MatchingRequest.status.is_distinct_from("accepted"))
+    return db.session.execute(
+        update.values(status=status, updated_at=datetime.utcnow()).returning(
+            MatchingRequest.id,
+            MatchingRequest.mentor_id,
+            MatchingRequest.mentee_id,
+            MatchingRequest.message,
+            MatchingRequest.status,
+        )
+    ).first()
+
+
+def status_update_failure(request_id, user_id):
+    """Error response for a set_request_status() call that matched no row"""
+    matching_request = db.session.get(MatchingRequest, request_id)
+    if not matching_request:
+        return jsonify({"error": "Request not found"}), 404
+    if matching_request.mentor_id != user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+    return already_accepted_response()
+
+
+def already_accepted_response():
+    return (
+        jsonify({"error": "You already have an accepted mentoring relationship"}),
+        400,
+    )
+
+
+def image_path(digest):
+    """Absolute path of the stored image with the given SHA-256"""
+    return os.path.abspath(
+        os.path.join(app.config["UPLOAD_FOLDER"], digest[:2], digest)
+    )
+
+
+def store_image(image_data):
+    """Write image bytes to the content-addressed store, if not already there
+
+    Returns the SHA-256 hex digest that names the file.
+    """
+    digest = hashlib.sha256(image_data).hexdigest()
+    path = image_path(digest)
+    if os.path.exists(path):
+        os.utime(path)  # in use again, so prune_images() must keep it
+        return digest
+
+    with atomic_write(path) as stored:
+        stored.write(image_data)
+    return digest
+
+
+@contextmanager
+def atomic_write(path):
+    """Write a file under a temporary name, moving it to path when done
+
+    Readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            yield temp_file
+        os.chmod(temp_path, 0o644)  # readable by a front proxy
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def prune_images(grace_seconds=3600):
+    """Delete stored images no profile refers to; returns how many
+
+    Files touched within grace_seconds are kept, since an upload writes its
+    file before the row that refers to it is committed.
+    """
+    referenced = set()
+    for digests in db.session.query(ProfileImage.sha256, ProfileImage.webp_sha256):
+        referenced.update(digests)
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for directory, _, names in os.walk(app.config["UPLOAD_FOLDER"]):
+        for name in names:
+            path = os.path.join(directory, name)
+            if (
+                re.fullmatch(r"[0-9a-f]{64}", name)
+                and os.path.basename(directory) == name[:2]
+                and name not in referenced
+                and os.path.getmtime(path) < cutoff
+            ):
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+IMAGE_VERSION_LENGTH = 16  # hex digits of the content hash in ?v=
+
+
+def profile_image_url(user):
+    """imageUrl for a user, versioned by content once they have uploaded one"""
+    url = f"/api/images/{user.role}/{user.id}"
+    if user.profile_image is not None:
+        url += f"?v={user.profile_image.sha256[:IMAGE_VERSION_LENGTH]}"
+    return url
+
+
+def send_stored_image(path, etag, mimetype, immutable=False):
+    """Respond with a file under UPLOAD_FOLDER without reading it into Python
+
+    The ETag comes from the content hash, so a matching If-None-Match gets
+    a 304 without touching the file. Pass immutable=True for versioned URLs.
+    """
+    accel_redirect = app.config["IMAGE_ACCEL_REDIRECT"]
+    # If-None-Match uses weak comparison; proxies that compress may send W/
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    elif accel_redirect:
+        relative = os.path.relpath(path, os.path.abspath(app.config["UPLOAD_FOLDER"]))
+        response = app.response_class(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = "/".join(
+            [accel_redirect.rstrip("/")] + relative.split(os.sep)
+        )
+    else:
+        # A real path lets the WSGI server use sendfile (wsgi.file_wrapper),
+        # or the proxy send it when USE_X_SENDFILE is on
+        response = send_file(path, mimetype=mimetype, etag=False)
+
+    response.set_etag(etag)
+    if immutable:
+        response.cache_control.no_cache = None  # send_file sets it by default
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config["IMAGE_CACHE_MAX_AGE"]
+        response.cache_control.immutable = True
+    else:
+        # Unversioned URLs may change content, so revalidate every time
+        response.cache_control.no_cache = True
+    return response
+
+
+def make_thumbnail(source, target, size, quality):
+    """Save a JPEG of the image at source, fitted to size x size, as target
+
+    Runs in the thumbnail pool; returns the thumbnail's size in bytes.
+    """
+    with Image.open(source) as image:
+        image.draft("RGB", (size, size))  # JPEGs decode at a reduced scale
+        thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((size, size), Image.LANCZOS)
+    with atomic_write(target) as output:
+        thumbnail.save(output, "JPEG", quality=quality, optimize=True)
+    return os.path.getsize(target)
+
+
+class ThumbnailCache:
+    """Bounded on-disk LRU of profile image thumbnails
+
+    Thumbnails are named by the source image's hash and their size, so an
+    entry never goes stale. Each one is made once, in a process pool, even
+    when several requests ask for it at the same time. Least recently used
+    files are deleted beyond THUMBNAIL_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self):
+        self.evictions = 0
+        self._entries = None  # file name -> bytes, oldest first; loaded lazily
+        self._size = 0
+        self._in_flight = {}  # file name -> Future
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path(digest, size):
+        return os.path.abspath(
+            os.path.join(
+                app.config["UPLOAD_FOLDER"],
+                "thumbnails",
+                digest[:2],
+                f"{digest}-{size}.jpg",
+            )
+        )
+
+    def get(self, digest, size):
+        """Path of a thumbnail of the stored image, making it if needed
+
+        Raises FutureTimeoutError if it takes longer than THUMBNAIL_TIMEOUT;
+        it is still finished and cached in the background. Errors from the
+        worker are raised as they are.
+        """
+        path = self.path(digest, size)
+        name = os.path.basename(path)
+        with self._lock:
+            self._load()
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                return path
+
+            future = self._in_flight.get(name)
+            leader = future is None
+            if leader:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=app.config["THUMBNAIL_WORKERS"]
+                    )
+                try:
+                    future = self._executor.submit(
+                        make_thumbnail,
+                        image_path(digest),
+                        path,
+                        size,
+                        app.config["THUMBNAIL_QUALITY"],
+                    )
+                except BrokenProcessPool:
+                    self._drop_executor(self._executor)
+                    raise
+                self._in_flight[name] = future
+            executor = self._executor
+
+        if leader:
+            # Recorded by whichever runs first: this callback, or a waiter
+            future.add_done_callback(lambda done: self._finished(name, done))
+        try:
+            future.result(timeout=app.config["THUMBNAIL_TIMEOUT"])
+        except BrokenProcessPool:
+            # A worker died (OOM kill, crash in a decoder) and the pool
+            # refuses all further work, so the next call starts a new one
+            with self._lock:
+                self._drop_executor(executor)
+            raise
+        finally:
+            if future.done():
+                self._finished(name, future)
+        return path
+
+    def _drop_executor(self, executor):
+        # Caller holds the lock; the pool may already have been replaced
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False)
+
+    def reset(self):
+        """Forget cached entries, e.g. after UPLOAD_FOLDER changes"""
+        with self._lock:
+            self._entries = None
+            self._size = 0
+
+    def _load(self):
+        """Pick up thumbnails left on disk by earlier runs, oldest first"""
+        if self._entries is not None:
+            return
+        found = []
+        root = os.path.join(app.config["UPLOAD_FOLDER"], "thumbnails")
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if name.endswith(".jpg"):
+                    stat = os.stat(os.path.join(directory, name))
+                    found.append((stat.st_mtime, name, stat.st_size))
+        self._entries = OrderedDict()
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._size += size
+        self._evict()
+
+    def _finished(self, name, future):
+        with self._lock:
+            if self._in_flight.get(name) is not future:
+                return  # already recorded
+            del self._in_flight[name]
+            if future.exception() is None and self._entries is not None:
+                self._entries[name] = future.result()
+                self._size += future.result()
+                self._evict()
+
+    def _evict(self):
+        # The newest entry always stays, even if it alone is over the limit
+        while self._size > app.config["THUMBNAIL_CACHE_MAX_BYTES"] and (
+            len(self._entries) > 1
+        ):
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            digest = name.split("-", 1)[0]
+            path = os.path.join(
+                app.config["UPLOAD_FOLDER"], "thumbnails", digest[:2], name
+            )
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+thumbnail_cache = ThumbnailCache()
+
+
+def normalize_image(image_data):
+    """Decode an upload once and re-encode it without metadata
+
+    Returns {content type: bytes}: a progressive JPEG, plus a WebP copy when
+    IMAGE_WEBP is on. EXIF orientation and ICC colors are applied first, so
+    dropping them doesn't change how the image looks. Transparent areas
+    become white.
+    """
+    with Image.open(io.BytesIO(image_data)) as upload:
+        # Decoding takes memory in proportion to the pixel count
+        if upload.width * upload.height > app.config["IMAGE_MAX_PIXELS"]:
+            raise ValueError("Image has too many pixels")
+        image = ImageOps.exif_transpose(upload)
+        icc_profile = upload.info.get("icc_profile")
+
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        flattened = Image.new("RGB", image.size, "white")
+        flattened.paste(image, mask=image.getchannel("A"))
+        image = flattened
+    else:
+        image = image.convert("RGB")
+
+    if icc_profile and ImageCms is not None:
+        try:
+            image = ImageCms.profileToProfile(
+                image,
+                ImageCms.ImageCmsProfile(io.BytesIO(icc_profile)),
+                ImageCms.createProfile("sRGB"),
+                outputMode="RGB",
+            )
+        except ImageCms.PyCMSError as e:
+            print(f"Ignoring unusable ICC profile: {e}")
+    image.info = {}  # nothing from the upload's metadata is written out
+
+    encoded = {}
+    buffer = io.BytesIO()
+    image.save(
+        buffer,
+        "JPEG",
+        quality=app.config["IMAGE_JPEG_QUALITY"],
+        progressive=True,
+        optimize=True,
+    )
+    encoded["image/jpeg"] = buffer.getvalue()
+    if app.config["IMAGE_WEBP"]:
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=app.config["IMAGE_WEBP_QUALITY"])
+        encoded["image/webp"] = buffer.getvalue()
+    return encoded
+
+
+def set_profile_image(user, image_data):
+    """Normalize and store an uploaded image, replacing any previous one"""
+    encoded = normalize_image(image_data)
+    if user.profile_image is None:
+        user.profile_image = ProfileImage()
+    profile_image = user.profile_image
+    profile_image.sha256 = store_image(encoded["image/jpeg"])
+    profile_image.content_type = "image/jpeg"
+    profile_image.webp_sha256 = (
+        store_image(encoded["image/webp"]) if "image/webp" in encoded else None
+    )
+    profile_image.updated_at = datetime.utcnow()
+
+
 def create_jwt_token(user):
     """Create JWT token with all required claims"""
     additional_claims = {
@@ -132,6 +1293,213 @@ def create_jwt_token(user):
     return create_access_token(identity=user.id, additional_claims=additional_claims)
 
 
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing queue is full"""
+
+
+_password_hasher = {}
+_password_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    """Return the hashing executor and its queue slots, creating them lazily"""
+    hasher = _password_hasher
+    if not hasher:
+        with _password_hasher_lock:
+            if not hasher:
+                workers = app.config["PASSWORD_HASH_WORKERS"]
+                if app.config["PASSWORD_HASH_EXECUTOR"] == "process":
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                else:
+                    executor = ThreadPoolExecutor(
+                        max_workers=workers, thread_name_prefix="password-hash"
+                    )
+                hasher["slots"] = threading.BoundedSemaphore(
+                    workers + app.config["PASSWORD_HASH_QUEUE_SIZE"]
+                )
+                hasher["executor"] = executor
+    return hasher["executor"], hasher["slots"]
+
+
+def shutdown_password_hasher():
+    """Stop the hashing pool; the next job starts one from current config"""
+    with _password_hasher_lock:
+        if _password_hasher:
+            _password_hasher.pop("executor").shutdown(wait=True)
+            _password_hasher.clear()
+
+
+def run_hashing_job(function, *args):
+    """Run a hashing function on the pool and wait for its result"""
+    executor, slots = get_password_hasher()
+    if not slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        future = executor.submit(function, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
+
+
+def hash_password(password):
+    """Hash a password with the configured method and work factor"""
+    return run_hashing_job(
+        generate_password_hash, password, app.config["PASSWORD_HASH_METHOD"]
+    )
+
+
+def verify_password(password_hash, password):
+    """Check a password against a stored hash"""
+    return run_hashing_job(check_password_hash, password_hash, password)
+
+
+def canonical_hash_method(method):
+    """Spell a hash method the way werkzeug records it in the stored hash
+
+    werkzeug fills in default parameters, so "pbkdf2" is stored as
+    "pbkdf2:sha256:600000" and "scrypt" as "scrypt:32768:8:1".
+    """
+    name, *args = method.split(":")
+    if name == "pbkdf2" and len(args) <= 2:
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    if name == "scrypt" and not args:
+        return "scrypt:32768:8:1"
+    if name == "scrypt" and len(args) == 3:
+        return "scrypt:{}:{}:{}".format(*map(int, args))
+    return method
+
+
+def password_needs_rehash(password_hash):
+    """True if a stored hash was made with a different method or work factor
+
+    Only compares method strings; the rehash itself goes through the pool.
+    """
+    method = canonical_hash_method(app.config["PASSWORD_HASH_METHOD"])
+    return password_hash.split("$", 1)[0] != method
+
+
+# Tokens issued before these times (user id -> unix time) are rejected, so
+# a role change can take effect before old tokens expire. The map is per
+# process; multi-process deployments should set AUTHORIZE_FROM_CLAIMS off
+# if roles ever change.
+_tokens_revoked_before = {}
+
+
+def revoke_user_tokens(user_id):
+    """Invalidate every token issued to a user before the current second"""
+    # Whole seconds, like the iat claim, so that a token issued right after
+    # the revocation (a fresh login, say) is still accepted
+    _tokens_revoked_before[int(user_id)] = int(time.time())
+
+
+@jwt.token_in_blocklist_loader
+def token_revoked(jwt_header, jwt_payload):
+    revoked_before = _tokens_revoked_before.get(int(jwt_payload["sub"]))
+    return revoked_before is not None and jwt_payload["iat"] < revoked_before
+
+
+def current_user_id():
+    """Id of the authenticated user (the JWT identity is a string)"""
+    return int(get_jwt_identity())
+
+
+def current_user_role():
+    """Role of the authenticated user, read from the token when allowed"""
+    if app.config["AUTHORIZE_FROM_CLAIMS"]:
+        role = get_jwt().get("role")
+        if role:
+            return role
+
+    # Claims disabled, or a token issued without a role claim
+    user = db.session.get(User, current_user_id())
+    return user.role if user else None
+
+
+# domain -> (deliverable, expiry on the time.monotonic() clock)
+_email_domain_cache = {}
+_email_domain_lock = threading.Lock()
+_email_checks_in_flight = set()
+_email_check_executor = ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="email-check"
+)
+
+
+def cached_domain_deliverability(domain):
+    """Cached DNS verdict for a domain: True, False, or None if unknown"""
+    entry = _email_domain_cache.get(domain)
+    if entry is None or entry[1] < time.monotonic():
+        return None
+    return entry[0]
+
+
+def check_email_domain(domain):
+    """Look up a domain's mail records and cache the verdict
+
+    Returns None when DNS gives no clear answer (timeouts, no nameservers,
+    resolver errors); such results are not cached.
+    """
+    try:
+        info = validate_email_deliverability(
+            domain, domain, timeout=app.config["EMAIL_DNS_TIMEOUT"]
+        )
+        deliverable = None if "unknown-deliverability" in info else True
+    except EmailUndeliverableError as e:
+        # email_validator raises this for definite answers (NXDOMAIN, null
+        # MX, no MX/A/AAAA records, SPF "-all"), but also wraps unexpected
+        # resolver errors in it. Those leave some other exception as the
+        # context and say nothing about the domain.
+        definite = e.__context__ is None or isinstance(
+            e.__context__, (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer)
+        )
+        deliverable = False if definite else None
+
+    if deliverable is not None:
+        with _email_domain_lock:
+            if len(_email_domain_cache) >= app.config["EMAIL_DOMAIN_CACHE_SIZE"]:
+                # Drop the oldest entry (dicts keep insertion order)
+                _email_domain_cache.pop(next(iter(_email_domain_cache)))
+            _email_domain_cache[domain] = (
+                deliverable,
+                time.monotonic() + app.config["EMAIL_DOMAIN_CACHE_TTL"],
+            )
+    return deliverable
+
+
+def _background_domain_check(domain):
+    try:
+        with app.app_context():
+            check_email_domain(domain)
+    finally:
+        with _email_domain_lock:
+            _email_checks_in_flight.discard(domain)
+
+
+def email_domain_accepted(domain):
+    """Apply the configured deliverability policy to an email domain"""
+    mode = app.config["EMAIL_DELIVERABILITY_CHECK"]
+    if mode == "off":
+        return True
+
+    deliverable = cached_domain_deliverability(domain)
+    if deliverable is None:
+        if mode == "sync":
+            deliverable = check_email_domain(domain)
+        else:
+            # Let this signup through; later ones see the cached verdict
+            with _email_domain_lock:
+                schedule = domain not in _email_checks_in_flight
+                _email_checks_in_flight.add(domain)
+            if schedule:
+                _email_check_executor.submit(_background_domain_check, domain)
+
+    # Unknown domains get the benefit of the doubt
+    return deliverable is not False
+
+
 # Routes
 @app.route("/")
 def index():
@@ -167,60 +1535,114 @@ def swagger_ui():
     """
 
 
+FALLBACK_OPENAPI_SPEC = {
+    "openapi": "3.0.1",
+    "info": {
+        "title": "Mentor-Mentee Matching API",
+        "version": "1.0.0",
+        "description": "API for mentor-mentee matching application",
+    },
+    "servers": [
+        {"url": "http://localhost:8080/api", "description": "Development server"}
+    ],
+    "paths": {},
+}
+
+# Parsed/serialized forms of openapi.yaml, rebuilt when the file changes
+_openapi_cache = {}
+_openapi_cache_lock = threading.Lock()
+
+
+def build_cached_document(body, mimetype):
+    """Precompute the encodings and strong ETags for a static document"""
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    encodings = {"identity": (body, digest)}
+    encodings["gzip"] = (gzip.compress(body, 9, mtime=0), f"{digest}-gzip")
+    if brotli is not None:
+        encodings["br"] = (brotli.compress(body), f"{digest}-br")
+    return {"mimetype": mimetype, "encodings": encodings}
+
+
+def load_openapi_documents():
+    """Return the cached OpenAPI JSON/YAML documents, reloading on mtime change"""
+    path = app.config["OPENAPI_SPEC_PATH"]
+    try:
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        version = None
+
+    cached = _openapi_cache.get(path)
+    if cached is not None and cached["version"] == version:
+        return cached
+
+    with _openapi_cache_lock:
+        cached = _openapi_cache.get(path)
+        if cached is not None and cached["version"] == version:
+            return cached
+
+        yaml_bytes = None
+        if version is not None:
+            try:
+                with open(path, "rb") as file:
+                    yaml_bytes = file.read()
+            except OSError:
+                pass
+
+        # The raw file is served as-is; only the JSON form needs it to parse
+        yaml_document = None
+        spec = FALLBACK_OPENAPI_SPEC
+        if yaml_bytes is not None:
+            yaml_document = build_cached_document(yaml_bytes, "application/x-yaml")
+            try:
+                spec = yaml.safe_load(yaml_bytes)
+            except yaml.YAMLError:
+                # Serve the basic spec if the YAML can't be parsed
+                spec = FALLBACK_OPENAPI_SPEC
+
+        cached = {
+            "version": version,
+            "json": build_cached_document(
+                app.json.dumps(spec).encode("utf-8"), "application/json"
+            ),
+            "yaml": yaml_document,
+        }
+        _openapi_cache[path] = cached
+        return cached
+
+
+def send_cached_document(document):
+    """Serve a precomputed document with content negotiation and 304 support"""
+    available = list(document["encodings"])
+    encoding = request.accept_encodings.best_match(
+        [name for name in ("br", "gzip") if name in available] + ["identity"],
+        default="identity",
+    )
+    body, etag = document["encodings"][encoding]
+
+    response = app.response_class(body, mimetype=document["mimetype"])
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    # Let clients keep a copy but revalidate it, which is a cheap 304
+    response.headers["Cache-Control"] = "no-cache"
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    return response.make_conditional(request)
+
+
 @app.route("/openapi.json")
 def openapi_spec():
     """Serve OpenAPI specification from YAML file"""
-    try:
-        # Load the OpenAPI YAML file from the project root
-        yaml_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'openapi.yaml')
-        
-        if os.path.exists(yaml_path):
-            with open(yaml_path, 'r', encoding='utf-8') as file:
-                spec = yaml.safe_load(file)
-            return jsonify(spec)
-        else:
-            # Fallback to basic spec if YAML file doesn't exist
-            return jsonify({
-                "openapi": "3.0.1",
-                "info": {
-                    "title": "Mentor-Mentee Matching API",
-                    "version": "1.0.0",
-                    "description": "API for mentor-mentee matching application",
-                },
-                "servers": [
-                    {"url": "http://localhost:8080/api", "description": "Development server"}
-                ],
-                "paths": {}
-            })
-    except Exception as e:
-        # Return basic spec if there's an error loading the YAML
-        return jsonify({
-            "openapi": "3.0.1",
-            "info": {
-                "title": "Mentor-Mentee Matching API",
-                "version": "1.0.0",
-                "description": "API for mentor-mentee matching application",
-            },
-            "servers": [
-                {"url": "http://localhost:8080/api", "description": "Development server"}
-            ],
-            "paths": {}
-        })
+    return send_cached_document(load_openapi_documents()["json"])
 
 
 @app.route("/openapi.yaml")
 def openapi_yaml():
     """Serve raw OpenAPI YAML specification"""
-    try:
-        # Load the OpenAPI YAML file from the project root
-        yaml_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'openapi.yaml')
-        
-        if os.path.exists(yaml_path):
-            return send_file(yaml_path, mimetype='application/x-yaml')
-        else:
-            return "OpenAPI YAML file not found", 404
-    except Exception:
-        return "Error serving OpenAPI YAML file", 500
+    document = load_openapi_documents()["yaml"]
+    if document is None:
+        return "OpenAPI YAML file not found", 404
+    return send_cached_document(document)
 
 
 # Authentication routes
@@ -235,11 +1657,13 @@ def signup():
             if field not in data or not data[field]:
                 return jsonify({"error": f"{field} is required"}), 400
 
-        # Validate email format
+        # Validate email format (syntax only; DNS checks follow the config)
         try:
-            validate_email(data["email"])
+            email_info = validate_email(data["email"], check_deliverability=False)
         except EmailNotValidError:
             return jsonify({"error": "Invalid email format"}), 400
+        if not email_domain_accepted(email_info.ascii_domain):
+            return jsonify({"error": "Invalid email format"}), 400
 
         # Validate role
         if data["role"] not in ["mentor", "mentee"]:
@@ -252,16 +1676,20 @@ def signup():
         # Create new user
         user = User(
             email=data["email"],
-            password_hash=generate_password_hash(data["password"]),
+            password_hash=hash_password(data["password"]),
             name=data["name"],
             role=data["role"],
         )
 
         db.session.add(user)
         db.session.commit()
+        if user.role == "mentor":
+            mentor_directory_cache.invalidate()
 
         return jsonify({"message": "User created successfully"}), 201
 
+    except PasswordHasherBusy:
+        return busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Internal server error"}), 500
@@ -279,7 +1707,12 @@ def login():
         user = User.query.filter_by(email=data["email"]).first()
         print(f"User found: {user.email if user else 'None'}")
 
-        if user and check_password_hash(user.password_hash, data["password"]):
+        if user and verify_password(user.password_hash, data["password"]):
+            # Upgrade hashes made with old parameters while we have the password
+            if password_needs_rehash(user.password_hash):
+                user.password_hash = hash_password(data["password"])
+                db.session.commit()
+
             token = create_jwt_token(user)
             print(f"Login successful for {user.email}, token created")
             return jsonify({"token": token}), 200
@@ -287,6 +1720,8 @@ def login():
             print("Invalid credentials")
             return jsonify({"error": "Invalid credentials"}), 401
 
+    except PasswordHasherBusy:
+        return busy_response()
     except Exception as e:
         print(f"Login error: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -299,7 +1734,7 @@ def get_me():
         user_id = get_jwt_identity()
         print(f"GET /api/me - User ID from token: {user_id}")
 
-        user = User.query.get(user_id)
+        user = db.session.get(User, user_id, options=[joinedload(User.profile_image)])
         print(f"User found: {user.email if user else 'None'}")
 
         if not user:
@@ -312,13 +1747,13 @@ def get_me():
             "profile": {
                 "name": user.name,
                 "bio": user.bio,
-                "imageUrl": f"/api/images/{user.role}/{user.id}",
+                "imageUrl": profile_image_url(user),
             },
         }
 
         # Add skills for mentors
         if user.role == "mentor":
-            skills = [skill.skill for skill in user.mentor_skills]
+            skills = [skill.skill.name for skill in user.mentor_skills]
             profile_data["profile"]["skills"] = skills
 
         print(f"Returning profile data: {profile_data}")
@@ -341,23 +1776,10 @@ def update_profile():
 
         data = request.get_json()
 
-        # Update basic profile fields
-        if "name" in data:
-            user.name = data["name"]
-        if "bio" in data:
-            user.bio = data["bio"]
-
-        # Update skills for mentors
-        if user.role == "mentor" and "skills" in data:
-            # Remove existing skills
-            MentorSkill.query.filter_by(user_id=user.id).delete()
-
-            # Add new skills
-            for skill in data["skills"]:
-                new_skill = MentorSkill(user_id=user.id, skill=skill)
-                db.session.add(new_skill)
-
-        db.session.commit()
+        if update_profile_fields(user, data):
+            db.session.commit()
+            if user.role == "mentor":
+                mentor_directory_cache.invalidate()
         return jsonify({"message": "Profile updated successfully"}), 200
 
     except Exception as e:
@@ -367,20 +1789,55 @@ def update_profile():
 
 @app.route("/api/images/<role>/<int:user_id>", methods=["GET"])
 def get_profile_image(role, user_id):
-    try:
-        user = User.query.get(user_id)
-
-        if not user or user.role != role:
-            # Return default image
-            default_url = f"https://placehold.co/500x500.jpg?text={role.upper()}"
-            return redirect(default_url)
+    size = request.args.get("size")
+    sizes = [str(allowed) for allowed in app.config["THUMBNAIL_SIZES"]]
+    if size is not None and size not in sizes:
+        return jsonify({"error": f"size must be one of {', '.join(sizes)}"}), 400
 
-        if user.profile_image:
-            return send_file(
-                io.BytesIO(user.profile_image),
-                mimetype="image/jpeg",
-                as_attachment=False,
+    try:
+        # Fetch only the files' hashes, checking the owner's role in the same query
+        image = (
+            db.session.query(
+                ProfileImage.sha256,
+                ProfileImage.content_type,
+                ProfileImage.webp_sha256,
             )
+            .join(User, User.id == ProfileImage.user_id)
+            .filter(User.id == user_id, User.role == role)
+            .first()
+        )
+
+        if image:
+            digest = image.sha256
+            # Only the current version's URL is safe to cache for good
+            versioned = request.args.get("v") == digest[:IMAGE_VERSION_LENGTH]
+            path, etag, mimetype = image_path(digest), digest, image.content_type
+            negotiated = False
+            if size and request.if_none_match.contains_weak(f"{digest}-{size}"):
+                # Answered with a 304, no file needed
+                etag, mimetype = f"{digest}-{size}", "image/jpeg"
+            elif size:
+                try:
+                    path = thumbnail_cache.get(digest, int(size))
+                    etag, mimetype = f"{digest}-{size}", "image/jpeg"
+                except FutureTimeoutError:
+                    versioned = False  # still being made: full image for now
+                except Exception as e:
+                    # The worker failed or died: full image instead
+                    print(f"Error making {size}px thumbnail of {digest}: {str(e)}")
+                    versioned = False
+            if not size and image.webp_sha256:
+                # Clients get WebP only when they name it in Accept
+                negotiated = True
+                best = request.accept_mimetypes.best_match([mimetype, "image/webp"])
+                if best == "image/webp":
+                    path = image_path(image.webp_sha256)
+                    etag, mimetype = image.webp_sha256, "image/webp"
+
+            response = send_stored_image(path, etag, mimetype, versioned)
+            if negotiated:
+                response.vary.add("Accept")
+            return response
         else:
             # Return default image
             default_url = f"https://placehold.co/500x500.jpg?text={role.upper()}"
@@ -398,7 +1855,7 @@ def update_profile_image(role, user_id):
         current_user_id = get_jwt_identity()
 
         # Check if user is updating their own image
-        if current_user_id != user_id:
+        if int(current_user_id) != user_id:
             return jsonify({"error": "Unauthorized"}), 403
 
         user = User.query.get(user_id)
@@ -415,11 +1872,19 @@ def update_profile_image(role, user_id):
         if not is_valid:
             return jsonify({"error": message}), 400
 
-        # Process and save image
+        # Process and save image. Validation only read the header, so a
+        # truncated or corrupt body only shows up when it is decoded here.
         image_data = file.read()
-        user.profile_image = image_data
+        try:
+            set_profile_image(user, image_data)
+        except (OSError, ValueError) as e:
+            db.session.rollback()
+            return jsonify({"error": f"Invalid image file: {str(e)}"}), 400
 
         db.session.commit()
+        if user.role == "mentor":
+            # Listed imageUrls carry the image version
+            mentor_directory_cache.invalidate()
         return jsonify({"message": "Profile image updated successfully"}), 200
 
     except Exception as e:
@@ -428,58 +1893,212 @@ def update_profile_image(role, user_id):
 
 
 # Mentor listing routes
+def find_mentors():
+    """List mentors for the current request's query parameters
+
+    Returns (mentor dicts, next page cursor or None). Raises ValueError for
+    invalid parameters.
+    """
+    # Get query parameters
+    skill_filter = request.args.get("skill")  # comma-separated
+    match = request.args.get("match", "all")  # 'all' or 'any' of the skills
+    search_terms = request.args.get("q")  # full-text over skills and bio
+    sort_by = request.args.get("sortBy", "name")  # 'name' or 'skill'
+    sort_order = request.args.get("sortOrder", "asc")  # 'asc' or 'desc'
+    cursor = request.args.get("cursor")
+
+    limit = parse_page_size()
+
+    # Base query for mentors; skills are fetched in one extra batched
+    # SELECT ... WHERE user_id IN (...) instead of one query per mentor
+    query = User.query.filter_by(role="mentor").options(
+        selectinload(User.mentor_skills), joinedload(User.profile_image)
+    )
+
+    if match not in ("all", "any"):
+        raise ValueError("match must be 'all' or 'any'")
+
+    # Each skill term resolves to skill ids once; the in-memory skill index
+    # then combines them into the matching mentor ids
+    terms = [term for term in (skill_filter or "").split(",") if term.strip()]
+    if terms:
+        mentor_ids = skill_index.mentors(
+            [matching_skill_ids(term) for term in terms], match == "all"
+        )
+        if not mentor_ids:
+            return [], None
+        # One JSON parameter instead of one bound parameter per id
+        query = query.filter(
+            User.id.in_(
+                db.select(literal_column("value")).select_from(
+                    func.json_each(json.dumps(mentor_ids))
+                )
+            )
+        )
+
+    # Text search goes through the full-text index: every word must match
+    # the start of a word in the mentor's skills or bio
+    sort_key = None
+    if search_terms:
+        fts_query = build_search_query(search_terms)
+        if fts_query is None:
+            return [], None
+
+        search = (
+            text(
+                "SELECT rowid AS user_id, bm25(mentor_search, 2.0, 1.0) AS rank "
+                "FROM mentor_search WHERE mentor_search MATCH :fts_query"
+            )
+            .bindparams(fts_query=fts_query)
+            .columns(user_id=db.Integer, rank=db.Float)
+            .subquery()
+        )
+        query = query.join(search, search.c.user_id == User.id)
+
+        # Best matches first unless the caller picked an order
+        if "sortBy" not in request.args:
+            sort_key, descending, ordering = search.c.rank, False, "rank"
+
+    # Apply sorting. Rows are ordered by (sort key, id) so that pages
+    # can resume strictly after the last row seen (keyset pagination).
+    if sort_key is None:
+        sort_key = (
+            User.skills_sort_key if sort_by == "skill" else mentor_name_sort_key()
+        )
+        descending = sort_order == "desc"
+        ordering = "{}:{}".format(
+            "skill" if sort_by == "skill" else "name",
+            "desc" if descending else "asc",
+        )
+
+    # Cursors are only valid for the ordering that produced them, and their
+    # values go straight into the SQL comparison, so check their types too
+    cursor_values = None
+    if cursor:
+        cursor_values = decode_cursor(cursor)
+        key_types = (int, float) if ordering == "rank" else str
+        if (
+            len(cursor_values) != 3
+            or cursor_values[0] != ordering
+            or not isinstance(cursor_values[1], key_types)
+            or isinstance(cursor_values[1], bool)
+            or type(cursor_values[2]) is not int
+        ):
+            raise ValueError("Invalid cursor")
+        cursor_values = cursor_values[1:]
+
+    query = apply_keyset(query, sort_key, User.id, descending, cursor_values)
+    query = query.add_columns(sort_key)
+
+    if limit is not None:
+        query = query.limit(limit + 1)
+    rows = query.all()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last_mentor, last_key = rows[-1]
+        next_cursor = encode_cursor([ordering, last_key, last_mentor.id])
+
+    mentor_list = []
+    for mentor, _ in rows:
+        skills = [skill.skill.name for skill in mentor.mentor_skills]
+        mentor_data = {
+            "id": mentor.id,
+            "email": mentor.email,
+            "role": mentor.role,
+            "profile": {
+                "name": mentor.name,
+                "bio": mentor.bio,
+                "imageUrl": profile_image_url(mentor),
+                "skills": skills,
+            },
+        }
+        mentor_list.append(mentor_data)
+
+    return mentor_list, next_cursor
+
+
+def render_mentor_directory():
+    """Serialize the mentor list, plus skill facets if ?facets=true
+
+    Returns (JSON bytes, next page cursor or None). Raises ValueError for
+    invalid parameters.
+    """
+    mentor_list, next_cursor = find_mentors()
+    if request.args.get("facets") == "true":
+        body = {"mentors": mentor_list, "facets": skill_facets()}
+    else:
+        body = mentor_list
+    return app.json.dumps(body).encode("utf-8"), next_cursor
+
+
 @app.route("/api/mentors", methods=["GET"])
 @jwt_required()
 def get_mentors():
     try:
-        # Get query parameters
-        skill_filter = request.args.get("skill")
-        sort_by = request.args.get("sortBy", "name")  # 'name' or 'skill'
-        sort_order = request.args.get("sortOrder", "asc")  # 'asc' or 'desc'
-
-        # Base query for mentors
-        query = User.query.filter_by(role="mentor")
-
-        # Apply skill filter
-        if skill_filter:
-            query = query.join(MentorSkill).filter(
-                MentorSkill.skill.ilike(f"%{skill_filter}%")
+        # The listing doesn't depend on who asks, so it is cached per set of
+        # query parameters until a mentor profile changes
+        cache_key = tuple(
+            request.args.get(name)
+            for name in (
+                "skill",
+                "match",
+                "q",
+                "sortBy",
+                "sortOrder",
+                "limit",
+                "cursor",
+                "facets",
+            )
+        )
+        try:
+            (body, next_cursor), hit = mentor_directory_cache.get_or_compute(
+                cache_key, render_mentor_directory
             )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Apply sorting
-        if sort_by == "name":
-            if sort_order == "desc":
-                query = query.order_by(User.name.desc())
-            else:
-                query = query.order_by(User.name.asc())
-
-        mentors = query.all()
-
-        mentor_list = []
-        for mentor in mentors:
-            skills = [skill.skill for skill in mentor.mentor_skills]
-            mentor_data = {
-                "id": mentor.id,
-                "email": mentor.email,
-                "role": mentor.role,
-                "profile": {
-                    "name": mentor.name,
-                    "bio": mentor.bio,
-                    "imageUrl": f"/api/images/mentor/{mentor.id}",
-                    "skills": skills,
-                },
-            }
-            mentor_list.append(mentor_data)
+        response = app.response_class(body, mimetype="application/json")
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response, 200
 
-        # Sort by skills if requested
-        if sort_by == "skill":
-            mentor_list.sort(
-                key=lambda x: ", ".join(x["skills"]), reverse=(sort_order == "desc")
-            )
+    except Exception as e:
+        return jsonify({"error": "Internal server error"}), 500
 
-        return jsonify(mentor_list), 200
+
+@app.route("/api/skills", methods=["GET"])
+@jwt_required()
+def get_skills():
+    """Skill facets: every skill with its mentor count"""
+    try:
+        return jsonify(skill_facets()), 200
 
     except Exception as e:
+        print(f"Error in get_skills: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route("/api/skills/suggest", methods=["GET"])
+@jwt_required()
+def suggest_skills():
+    """Autocomplete skill names from the in-memory skill index"""
+    try:
+        try:
+            limit = parse_page_size() or 10
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        suggestions = skill_index.suggest(request.args.get("q", ""), limit)
+        return (
+            jsonify([{"name": name, "mentors": count} for name, count in suggestions]),
+            200,
+        )
+
+    except Exception as e:
+        print(f"Error in suggest_skills: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 
@@ -488,10 +2107,10 @@ def get_mentors():
 @jwt_required()
 def create_request():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user_id = current_user_id()
+        role = current_user_role()
 
-        if user.role != "mentee":
+        if role != "mentee":
             return jsonify({"error": "Only mentees can send requests"}), 403
 
         data = request.get_json()
@@ -499,34 +2118,19 @@ def create_request():
         if "mentorId" not in data:
             return jsonify({"error": "mentorId is required"}), 400
 
-        mentor_id = data["mentorId"]
-        mentor = User.query.get(mentor_id)
+        # The mentor check and the pending/duplicate rules are all enforced
+        # by the insert itself
+        try:
+            new_request = insert_match_request(
+                data["mentorId"], user_id, data.get("message", "")
+            )
+        except IntegrityError:
+            return request_creation_failure(user_id)
 
-        if not mentor or mentor.role != "mentor":
+        if not new_request:
+            db.session.rollback()
             return jsonify({"error": "Mentor not found"}), 404
 
-        # Check if mentee already has a pending request
-        existing_request = MatchingRequest.query.filter_by(
-            mentee_id=user_id, status="pending"
-        ).first()
-
-        if existing_request:
-            return jsonify({"error": "You already have a pending request"}), 400
-
-        # Check if request to this mentor already exists
-        existing_to_mentor = MatchingRequest.query.filter_by(
-            mentor_id=mentor_id, mentee_id=user_id
-        ).first()
-
-        if existing_to_mentor:
-            return jsonify({"error": "Request to this mentor already exists"}), 400
-
-        # Create new request
-        new_request = MatchingRequest(
-            mentor_id=mentor_id, mentee_id=user_id, message=data.get("message", "")
-        )
-
-        db.session.add(new_request)
         db.session.commit()
 
         return jsonify({"message": "Request sent successfully"}), 201
@@ -540,17 +2144,29 @@ def create_request():
 @jwt_required()
 def get_requests():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-
-        if user.role == "mentee":
-            # Get requests sent by mentee
-            requests = MatchingRequest.query.filter_by(mentee_id=user_id).all()
+        user_id = current_user_id()
+        role = current_user_role()
+
+        if role == "mentee":
+            # Get requests sent by mentee, with each mentor and their skills
+            # loaded up front rather than one lookup per request
+            requests = (
+                MatchingRequest.query.filter_by(mentee_id=user_id)
+                .options(
+                    joinedload(MatchingRequest.mentor).selectinload(
+                        User.mentor_skills
+                    ),
+                    joinedload(MatchingRequest.mentor).joinedload(
+                        User.profile_image
+                    ),
+                )
+                .all()
+            )
             request_list = []
 
             for req in requests:
-                mentor = User.query.get(req.mentor_id)
-                skills = [skill.skill for skill in mentor.mentor_skills]
+                mentor = req.mentor
+                skills = [skill.skill.name for skill in mentor.mentor_skills]
 
                 request_data = {
                     "id": req.id,
@@ -558,7 +2174,7 @@ def get_requests():
                         "id": mentor.id,
                         "name": mentor.name,
                         "bio": mentor.bio,
-                        "imageUrl": f"/api/images/mentor/{mentor.id}",
+                        "imageUrl": profile_image_url(mentor),
                         "skills": skills,
                     },
                     "message": req.message,
@@ -568,13 +2184,19 @@ def get_requests():
                 }
                 request_list.append(request_data)
 
-        elif user.role == "mentor":
-            # Get requests received by mentor
-            requests = MatchingRequest.query.filter_by(mentor_id=user_id).all()
+        elif role == "mentor":
+            # Get requests received by mentor, joined with their mentees
+            requests = (
+                MatchingRequest.query.filter_by(mentor_id=user_id)
+                .options(
+                    joinedload(MatchingRequest.mentee).joinedload(User.profile_image)
+                )
+                .all()
+            )
             request_list = []
 
             for req in requests:
-                mentee = User.query.get(req.mentee_id)
+                mentee = req.mentee
 
                 request_data = {
                     "id": req.id,
@@ -582,7 +2204,7 @@ def get_requests():
                         "id": mentee.id,
                         "name": mentee.name,
                         "bio": mentee.bio,
-                        "imageUrl": f"/api/images/mentee/{mentee.id}",
+                        "imageUrl": profile_image_url(mentee),
                     },
                     "message": req.message,
                     "status": req.status,
@@ -601,44 +2223,33 @@ def get_requests():
 @jwt_required()
 def update_request(request_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-
-        matching_request = MatchingRequest.query.get(request_id)
-        if not matching_request:
-            return jsonify({"error": "Request not found"}), 404
+        user_id = current_user_id()
+        role = current_user_role()
 
         data = request.get_json()
+        status = data.get("status")
 
-        if user.role == "mentor" and matching_request.mentor_id == user_id:
-            # Mentor accepting/rejecting request
-            if "status" not in data or data["status"] not in ["accepted", "rejected"]:
-                return jsonify({"error": "Valid status is required"}), 400
-
-            # If accepting, check if mentor already has an accepted request
-            if data["status"] == "accepted":
-                existing_accepted = MatchingRequest.query.filter_by(
-                    mentor_id=user_id, status="accepted"
-                ).first()
-
-                if existing_accepted:
-                    return (
-                        jsonify(
-                            {
-                                "error": "You already have an accepted mentoring relationship"
-                            }
-                        ),
-                        400,
-                    )
-
-            matching_request.status = data["status"]
-            matching_request.updated_at = datetime.utcnow()
-
-        else:
+        # Mentor accepting/rejecting request: one conditional UPDATE, with
+        # the unique index on accepted requests rejecting a second mentee
+        if role == "mentor" and status in ["accepted", "rejected"]:
+            try:
+                updated = set_request_status(request_id, user_id, status)
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                return already_accepted_response()
+            if updated:
+                return jsonify({"message": "Request updated successfully"}), 200
+
+        # Nothing was updated; work out why
+        matching_request = db.session.get(MatchingRequest, request_id)
+        if not matching_request:
+            return jsonify({"error": "Request not found"}), 404
+        if role != "mentor" or matching_request.mentor_id != user_id:
             return jsonify({"error": "Unauthorized"}), 403
-
-        db.session.commit()
-        return jsonify({"message": "Request updated successfully"}), 200
+        if status not in ["accepted", "rejected"]:
+            return jsonify({"error": "Valid status is required"}), 400
+        return already_accepted_response()
 
     except Exception as e:
         db.session.rollback()
@@ -649,7 +2260,7 @@ def update_request(request_id):
 @jwt_required()
 def delete_request(request_id):
     try:
-        user_id = get_jwt_identity()
+        user_id = current_user_id()
 
         matching_request = MatchingRequest.query.get(request_id)
         if not matching_request:
@@ -675,10 +2286,10 @@ def delete_request(request_id):
 def create_match_request():
     """Create matching request according to API spec"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user_id = current_user_id()
+        role = current_user_role()
 
-        if user.role != "mentee":
+        if role != "mentee":
             return jsonify({"error": "Only mentees can send requests"}), 403
 
         data = request.get_json()
@@ -686,34 +2297,19 @@ def create_match_request():
         if "mentorId" not in data:
             return jsonify({"error": "mentorId is required"}), 400
 
-        mentor_id = data["mentorId"]
-        mentor = User.query.get(mentor_id)
+        # The mentor check and the pending/duplicate rules are all enforced
+        # by the insert itself
+        try:
+            new_request = insert_match_request(
+                data["mentorId"], user_id, data.get("message", "")
+            )
+        except IntegrityError:
+            return request_creation_failure(user_id)
 
-        if not mentor or mentor.role != "mentor":
+        if not new_request:
+            db.session.rollback()
             return jsonify({"error": "Mentor not found"}), 400
 
-        # Check if mentee already has a pending request
-        existing_request = MatchingRequest.query.filter_by(
-            mentee_id=user_id, status="pending"
-        ).first()
-
-        if existing_request:
-            return jsonify({"error": "You already have a pending request"}), 400
-
-        # Check if request to this mentor already exists
-        existing_to_mentor = MatchingRequest.query.filter_by(
-            mentor_id=mentor_id, mentee_id=user_id
-        ).first()
-
-        if existing_to_mentor:
-            return jsonify({"error": "Request to this mentor already exists"}), 400
-
-        # Create new request
-        new_request = MatchingRequest(
-            mentor_id=mentor_id, mentee_id=user_id, message=data.get("message", "")
-        )
-
-        db.session.add(new_request)
         db.session.commit()
 
         # Return response according to API spec
@@ -737,13 +2333,18 @@ def create_match_request():
 def get_incoming_requests():
     """Get incoming requests for mentors"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user_id = current_user_id()
+        role = current_user_role()
 
-        if user.role != "mentor":
+        if role != "mentor":
             return jsonify({"error": "Only mentors can view incoming requests"}), 403
 
-        requests = MatchingRequest.query.filter_by(mentor_id=user_id).all()
+        try:
+            requests, next_cursor = match_request_page(
+                MatchingRequest.query.filter_by(mentor_id=user_id)
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         request_list = []
 
         for req in requests:
@@ -756,7 +2357,10 @@ def get_incoming_requests():
             }
             request_list.append(request_data)
 
-        return jsonify(request_list), 200
+        response = jsonify(request_list)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response, 200
 
     except Exception as e:
         return jsonify({"error": "Internal server error"}), 500
@@ -767,13 +2371,18 @@ def get_incoming_requests():
 def get_outgoing_requests():
     """Get outgoing requests for mentees"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user_id = current_user_id()
+        role = current_user_role()
 
-        if user.role != "mentee":
+        if role != "mentee":
             return jsonify({"error": "Only mentees can view outgoing requests"}), 403
 
-        requests = MatchingRequest.query.filter_by(mentee_id=user_id).all()
+        try:
+            requests, next_cursor = match_request_page(
+                MatchingRequest.query.filter_by(mentee_id=user_id)
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         request_list = []
 
         for req in requests:
@@ -785,7 +2394,10 @@ def get_outgoing_requests():
             }
             request_list.append(request_data)
 
-        return jsonify(request_list), 200
+        response = jsonify(request_list)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response, 200
 
     except Exception as e:
         return jsonify({"error": "Internal server error"}), 500
@@ -796,35 +2408,22 @@ def get_outgoing_requests():
 def accept_request(request_id):
     """Accept a matching request"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user_id = current_user_id()
+        role = current_user_role()
 
-        if user.role != "mentor":
+        if role != "mentor":
             return jsonify({"error": "Only mentors can accept requests"}), 403
 
-        matching_request = MatchingRequest.query.get(request_id)
+        # One conditional UPDATE; the unique index on accepted requests
+        # rejects a second accepted mentee, even under concurrent accepts
+        try:
+            matching_request = set_request_status(request_id, user_id, "accepted")
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return already_accepted_response()
         if not matching_request:
-            return jsonify({"error": "Request not found"}), 404
-
-        if matching_request.mentor_id != int(user_id):  # Convert user_id to int
-            return jsonify({"error": "Unauthorized"}), 403
-
-        # Check if mentor already has an accepted request
-        existing_accepted = MatchingRequest.query.filter_by(
-            mentor_id=user_id, status="accepted"
-        ).first()
-
-        if existing_accepted:
-            return (
-                jsonify(
-                    {"error": "You already have an accepted mentoring relationship"}
-                ),
-                400,
-            )
-
-        matching_request.status = "accepted"
-        matching_request.updated_at = datetime.utcnow()
-        db.session.commit()
+            return status_update_failure(request_id, user_id)
 
         response_data = {
             "id": matching_request.id,
@@ -846,22 +2445,16 @@ def accept_request(request_id):
 def reject_request(request_id):
     """Reject a matching request"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user_id = current_user_id()
+        role = current_user_role()
 
-        if user.role != "mentor":
+        if role != "mentor":
             return jsonify({"error": "Only mentors can reject requests"}), 403
 
-        matching_request = MatchingRequest.query.get(request_id)
-        if not matching_request:
-            return jsonify({"error": "Request not found"}), 404
-
-        if matching_request.mentor_id != user_id:
-            return jsonify({"error": "Unauthorized"}), 403
-
-        matching_request.status = "rejected"
-        matching_request.updated_at = datetime.utcnow()
+        matching_request = set_request_status(request_id, user_id, "rejected")
         db.session.commit()
+        if not matching_request:
+            return status_update_failure(request_id, user_id)
 
         response_data = {
             "id": matching_request.id,
@@ -883,10 +2476,10 @@ def reject_request(request_id):
 def cancel_request(request_id):
     """Cancel/delete a matching request"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user_id = current_user_id()
+        role = current_user_role()
 
-        if user.role != "mentee":
+        if role != "mentee":
             return jsonify({"error": "Only mentees can cancel requests"}), 403
 
         matching_request = MatchingRequest.query.get(request_id)
@@ -917,6 +2510,13 @@ def cancel_request(request_id):
 
 
 # Error handlers
+def busy_response():
+    """503 for when the password hashing queue is saturated"""
+    response = jsonify({"error": "Server busy, please retry shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({"error": "Not found"}), 404
@@ -951,7 +2551,7 @@ def profile_spec():
 
             if user.role == "mentor":
                 # Get skills from relationship
-                skills = [skill.skill for skill in user.mentor_skills]
+                skills = [skill.skill.name for skill in user.mentor_skills]
                 profile_data["skills"] = skills
                 # Note: availability is not in the current model
             # Note: interests is not in the current model for mentees
@@ -964,57 +2564,32 @@ def profile_spec():
         # Handle PUT request
         data = request.get_json()
 
-        # Update basic profile fields
-        if "name" in data:
-            user.name = data["name"]
-        if "bio" in data:
-            user.bio = data["bio"]
-
         # Handle base64 image upload
+        image_changed = False
         if "image" in data and data["image"]:
             try:
-                # Decode base64 image
-                import base64
-
-                image_data = base64.b64decode(data["image"])
-
-                # Validate image
-                image = Image.open(io.BytesIO(image_data))
-                width, height = image.size
-
-                if width < 500 or height < 500 or width > 1000 or height > 1000:
-                    return (
-                        jsonify(
-                            {
-                                "error": "Image must be between 500x500 and 1000x1000 pixels"
-                            }
-                        ),
-                        400,
-                    )
-
-                if width != height:
-                    return jsonify({"error": "Image must be square"}), 400
-
-                if len(image_data) > 1024 * 1024:  # 1MB
+                # Turn oversized payloads away before decoding them
+                encoded = data["image"]
+                if base64_decoded_size(encoded) > app.config["IMAGE_MAX_BYTES"]:
                     return jsonify({"error": "Image size must be less than 1MB"}), 400
 
-                user.profile_image = image_data
+                image_data = base64.b64decode(encoded)
+                error = image_error(io.BytesIO(image_data))
+                if error:
+                    return jsonify({"error": error}), 400
+
+                set_profile_image(user, image_data)
+                image_changed = True
 
             except Exception as img_error:
                 return jsonify({"error": f"Invalid image data: {str(img_error)}"}), 400
 
-        # Update skills for mentors
-        if user.role == "mentor" and "skills" in data:
-            # Remove existing skills
-            MentorSkill.query.filter_by(user_id=user.id).delete()
-
-            # Add new skills
-            if data["skills"]:
-                for skill in data["skills"]:
-                    new_skill = MentorSkill(user_id=user.id, skill=skill)
-                    db.session.add(new_skill)
+        # Update name, bio and skills; saving unchanged values is a no-op
+        changed = update_profile_fields(user, data)
 
         db.session.commit()
+        if (changed or image_changed) and user.role == "mentor":
+            mentor_directory_cache.invalidate()
 
         # Return updated profile data according to spec
         profile_data = {
@@ -1024,12 +2599,12 @@ def profile_spec():
             "profile": {
                 "name": user.name,
                 "bio": user.bio,
-                "imageUrl": f"/api/images/{user.role}/{user.id}",
+                "imageUrl": profile_image_url(user),
             },
         }
 
         if user.role == "mentor":
-            skills = [skill.skill for skill in user.mentor_skills]
+            skills = [skill.skill.name for skill in user.mentor_skills]
             profile_data["profile"]["skills"] = skills
 
         return jsonify(profile_data), 200
@@ -1046,8 +2621,365 @@ def api_docs():
     return redirect("/swagger-ui")
 
 
+# Schema migrations
+#
+# db.create_all() only creates missing tables, so changes to existing tables
+# are applied here. The schema version lives in SQLite's PRAGMA user_version;
+# each entry in MIGRATIONS moves the database up by one version.
+def _migrate_profile_images(connection):
+    """Move profile image blobs from user.profile_image into profile_image"""
+    # The blob-era table; _move_profile_images_to_store() converts it
+    connection.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS profile_image ("
+        "user_id INTEGER NOT NULL, data BLOB NOT NULL, updated_at DATETIME, "
+        "PRIMARY KEY (user_id), FOREIGN KEY(user_id) REFERENCES user (id))"
+    )
+
+    columns = [column["name"] for column in inspect(connection).get_columns("user")]
+    if "profile_image" not in columns:
+        return
+
+    # Copy inside SQLite so blobs are never materialized in Python
+    connection.exec_driver_sql(
+        "INSERT OR IGNORE INTO profile_image (user_id, data, updated_at) "
+        "SELECT id, profile_image, CURRENT_TIMESTAMP FROM user "
+        "WHERE profile_image IS NOT NULL"
+    )
+    connection.exec_driver_sql("ALTER TABLE user DROP COLUMN profile_image")
+
+
+def _add_lookup_indexes(connection):
+    """Index the matching-request and mentor-skill lookup columns"""
+    for statement in [
+        "CREATE INDEX IF NOT EXISTS ix_mentor_skill_user_id "
+        "ON mentor_skill (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_mentor_skill_skill ON mentor_skill (skill)",
+        "CREATE INDEX IF NOT EXISTS ix_matching_request_mentee_status "
+        "ON matching_request (mentee_id, status)",
+        "CREATE INDEX IF NOT EXISTS ix_matching_request_mentor_status "
+        "ON matching_request (mentor_id, status)",
+        "CREATE INDEX IF NOT EXISTS ix_matching_request_mentor_mentee "
+        "ON matching_request (mentor_id, mentee_id)",
+        "CREATE INDEX IF NOT EXISTS ix_matching_request_pending_mentee "
+        "ON matching_request (mentee_id) WHERE status = 'pending'",
+        "CREATE INDEX IF NOT EXISTS ix_matching_request_accepted_mentor "
+        "ON matching_request (mentor_id) WHERE status = 'accepted'",
+    ]:
+        connection.exec_driver_sql(statement)
+
+
+def _create_mentor_search_index(connection):
+    """Create the mentor_search full-text index and fill it from mentor rows"""
+    connection.exec_driver_sql(MENTOR_SEARCH_DDL)
+    connection.exec_driver_sql("DELETE FROM mentor_search")
+    connection.exec_driver_sql(
+        "INSERT INTO mentor_search (rowid, skills, bio) "
+        "SELECT user.id, "
+        "COALESCE((SELECT group_concat(skill, char(10)) FROM mentor_skill "
+        "WHERE mentor_skill.user_id = user.id), ''), COALESCE(user.bio, '') "
+        "FROM user WHERE role = 'mentor'"
+    )
+
+
+def _add_mentor_name_index(connection):
+    """Index mentor names for keyset pagination of the mentor directory"""
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_user_role_name "
+        "ON user (role, coalesce(name, ''), id)"
+    )
+
+
+def _add_request_feed_indexes(connection):
+    """Replace the (user, status) request indexes with created_at-ordered ones"""
+    for statement in [
+        "CREATE INDEX IF NOT EXISTS ix_matching_request_mentee_feed "
+        "ON matching_request (mentee_id, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_matching_request_mentor_feed "
+        "ON matching_request (mentor_id, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_matching_request_mentee_created "
+        "ON matching_request (mentee_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_matching_request_mentor_created "
+        "ON matching_request (mentor_id, created_at)",
+        "DROP INDEX IF EXISTS ix_matching_request_mentee_status",
+        "DROP INDEX IF EXISTS ix_matching_request_mentor_status",
+    ]:
+        connection.exec_driver_sql(statement)
+
+
+def _add_mentor_skills_sort_key(connection):
+    """Add user.skills_sort_key, index it and fill it from mentor_skill"""
+    columns = [column["name"] for column in inspect(connection).get_columns("user")]
+    if "skills_sort_key" not in columns:
+        connection.exec_driver_sql(
+            "ALTER TABLE user ADD COLUMN skills_sort_key TEXT NOT NULL DEFAULT ''"
+        )
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_user_role_skills "
+        "ON user (role, skills_sort_key, id)"
+    )
+
+    # Built in Python so the key matches mentor_skills_key() exactly
+    # (SQLite's lower() only folds ASCII)
+    skills_by_user = {}
+    for user_id, skill in connection.exec_driver_sql(
+        "SELECT user_id, skill FROM mentor_skill ORDER BY user_id, id"
+    ):
+        skills_by_user.setdefault(user_id, []).append(skill)
+    if skills_by_user:
+        connection.exec_driver_sql(
+            "UPDATE user SET skills_sort_key = ? WHERE id = ?",
+            [
+                (mentor_skills_key(skills), user_id)
+                for user_id, skills in skills_by_user.items()
+            ],
+        )
+
+
+def _normalize_skills(connection):
+    """Move skill names into the skill table and link mentor_skill by id"""
+    connection.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS skill (id INTEGER NOT NULL, "
+        "name VARCHAR(50) NOT NULL, normalized_name VARCHAR(50) NOT NULL, "
+        "PRIMARY KEY (id))"
+    )
+    connection.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_skill_normalized_name "
+        "ON skill (normalized_name)"
+    )
+
+    columns = [c["name"] for c in inspect(connection).get_columns("mentor_skill")]
+    if "skill_id" in columns:
+        return
+
+    # Same rules as resolve_skills(): first spelling wins, and a mentor
+    # listing one skill twice (in any case) keeps only the first row
+    skill_ids, links, keys = {}, {}, {}
+    for row_id, user_id, name in connection.exec_driver_sql(
+        "SELECT id, user_id, skill FROM mentor_skill ORDER BY id"
+    ).fetchall():
+        normalized = normalize_skill(name)
+        if not normalized:
+            continue
+        if normalized not in skill_ids:
+            skill_ids[normalized] = connection.exec_driver_sql(
+                "INSERT INTO skill (name, normalized_name) VALUES (?, ?)",
+                (" ".join(name.split()), normalized),
+            ).lastrowid
+        link = (user_id, skill_ids[normalized])
+        if link not in links:
+            links[link] = row_id
+            keys.setdefault(user_id, []).append(normalized)
+
+    # SQLite can't change a column's meaning in place, so rebuild the table
+    connection.exec_driver_sql(
+        "CREATE TABLE mentor_skill_new (id INTEGER NOT NULL, "
+        "user_id INTEGER NOT NULL, skill_id INTEGER NOT NULL, PRIMARY KEY (id), "
+        "CONSTRAINT uq_mentor_skill_user_skill UNIQUE (user_id, skill_id), "
+        "FOREIGN KEY(user_id) REFERENCES user (id), "
+        "FOREIGN KEY(skill_id) REFERENCES skill (id))"
+    )
+    if links:
+        connection.exec_driver_sql(
+            "INSERT INTO mentor_skill_new (id, user_id, skill_id) VALUES (?, ?, ?)",
+            [
+                (row_id, user_id, skill_id)
+                for (user_id, skill_id), row_id in links.items()
+            ],
+        )
+    connection.exec_driver_sql("DROP TABLE mentor_skill")
+    connection.exec_driver_sql("ALTER TABLE mentor_skill_new RENAME TO mentor_skill")
+    connection.exec_driver_sql(
+        "CREATE INDEX ix_mentor_skill_skill_user ON mentor_skill (skill_id, user_id)"
+    )
+
+    # Sort keys now follow the normalized, de-duplicated lists
+    connection.exec_driver_sql("UPDATE user SET skills_sort_key = ''")
+    if keys:
+        connection.exec_driver_sql(
+            "UPDATE user SET skills_sort_key = ? WHERE id = ?",
+            [(", ".join(names), user_id) for user_id, names in keys.items()],
+        )
+
+
+def _add_skill_mentor_counts(connection):
+    """Add skill.mentor_count and fill it from mentor_skill"""
+    columns = [column["name"] for column in inspect(connection).get_columns("skill")]
+    if "mentor_count" not in columns:
+        connection.exec_driver_sql(
+            "ALTER TABLE skill ADD COLUMN mentor_count INTEGER NOT NULL DEFAULT 0"
+        )
+    connection.exec_driver_sql(RECONCILE_SKILL_COUNTS_SQL)
+
+
+def _enforce_one_active_request(connection):
+    """Make the one-pending-per-mentee / one-accepted-per-mentor rules unique
+
+    Existing violations are resolved first: a mentor keeps the request they
+    accepted first (the rest become rejected) and a mentee keeps their
+    oldest pending request (the rest become cancelled).
+    """
+    for status, owner, order, resolution in [
+        ("accepted", "mentor_id", "updated_at, id", "rejected"),
+        ("pending", "mentee_id", "created_at, id", "cancelled"),
+    ]:
+        connection.exec_driver_sql(
+            f"UPDATE matching_request SET status = '{resolution}', "
+            "updated_at = CURRENT_TIMESTAMP "
+            f"WHERE id IN (SELECT id FROM (SELECT id, row_number() OVER ("
+            f"PARTITION BY {owner} ORDER BY {order}) AS position "
+            f"FROM matching_request WHERE status = '{status}') WHERE position > 1)"
+        )
+
+    for statement in [
+        "DROP INDEX IF EXISTS ix_matching_request_pending_mentee",
+        "DROP INDEX IF EXISTS ix_matching_request_accepted_mentor",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_matching_request_pending_mentee "
+        "ON matching_request (mentee_id) WHERE status = 'pending'",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_matching_request_accepted_mentor "
+        "ON matching_request (mentor_id) WHERE status = 'accepted'",
+    ]:
+        connection.exec_driver_sql(statement)
+
+
+def _make_request_pairs_unique(connection):
+    """Replace the mentor/mentee lookup index with a unique one
+
+    Where a mentee has asked the same mentor more than once, the request
+    that matters most is kept (accepted, then pending, then the newest).
+    The others move to matching_request_archive, so no history is lost.
+    """
+    connection.exec_driver_sql(
+        "CREATE TEMP TABLE duplicate_request AS SELECT id FROM ("
+        "SELECT id, row_number() OVER (PARTITION BY mentor_id, mentee_id ORDER BY "
+        "status = 'accepted' DESC, status = 'pending' DESC, created_at DESC, "
+        "id DESC) AS position FROM matching_request) WHERE position > 1"
+    )
+    duplicates = connection.exec_driver_sql(
+        "SELECT count(*) FROM duplicate_request"
+    ).scalar()
+    if duplicates:
+        connection.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS matching_request_archive AS "
+            "SELECT * FROM matching_request WHERE 0"
+        )
+        for statement in [
+            "INSERT INTO matching_request_archive SELECT * FROM matching_request "
+            "WHERE id IN (SELECT id FROM duplicate_request)",
+            "DELETE FROM matching_request "
+            "WHERE id IN (SELECT id FROM duplicate_request)",
+        ]:
+            connection.exec_driver_sql(statement)
+        print(f"Archived {duplicates} duplicate match requests")
+    connection.exec_driver_sql("DROP TABLE duplicate_request")
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_matching_request_mentor_mentee")
+    connection.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_matching_request_mentor_mentee "
+        "ON matching_request (mentor_id, mentee_id)"
+    )
+
+
+def _move_profile_images_to_store(connection):
+    """Write profile_image blobs to the image store and keep only their hash"""
+    connection.exec_driver_sql("ALTER TABLE profile_image RENAME TO profile_image_old")
+    ProfileImage.__table__.create(connection)
+
+    # One blob in memory at a time
+    user_ids = connection.exec_driver_sql("SELECT user_id FROM profile_image_old")
+    for user_id in [user_id for (user_id,) in user_ids]:
+        data, updated_at = connection.exec_driver_sql(
+            "SELECT data, updated_at FROM profile_image_old WHERE user_id = ?",
+            (user_id,),
+        ).one()
+        connection.exec_driver_sql(
+            "INSERT INTO profile_image (user_id, sha256, updated_at) VALUES (?, ?, ?)",
+            (user_id, store_image(data), updated_at),
+        )
+    connection.exec_driver_sql("DROP TABLE profile_image_old")
+
+
+def _add_profile_image_formats(connection):
+    """Record each stored image's real content type, and room for WebP"""
+    columns = [c["name"] for c in inspect(connection).get_columns("profile_image")]
+    if "content_type" not in columns:
+        connection.exec_driver_sql(
+            "ALTER TABLE profile_image ADD COLUMN "
+            "content_type VARCHAR(20) NOT NULL DEFAULT 'image/jpeg'"
+        )
+    if "webp_sha256" not in columns:
+        connection.exec_driver_sql(
+            "ALTER TABLE profile_image ADD COLUMN webp_sha256 VARCHAR(64)"
+        )
+
+    # Images uploaded before normalization were stored as sent (often PNG)
+    rows = connection.exec_driver_sql("SELECT user_id, sha256 FROM profile_image")
+    for user_id, digest in rows.fetchall():
+        try:
+            with Image.open(image_path(digest)) as image:
+                content_type = Image.MIME.get(image.format, "image/jpeg")
+        except (OSError, Image.UnidentifiedImageError) as e:
+            print(f"Skipping stored image {digest}: {e}")
+            continue
+        connection.exec_driver_sql(
+            "UPDATE profile_image SET content_type = ? WHERE user_id = ?",
+            (content_type, user_id),
+        )
+
+
+MIGRATIONS = [
+    _migrate_profile_images,
+    _add_lookup_indexes,
+    _create_mentor_search_index,
+    _add_mentor_name_index,
+    _add_request_feed_indexes,
+    _add_mentor_skills_sort_key,
+    _normalize_skills,
+    _add_skill_mentor_counts,
+    _enforce_one_active_request,
+    _make_request_pairs_unique,
+    _move_profile_images_to_store,
+    _add_profile_image_formats,
+]
+
+
+def migrate_database():
+    """Create or upgrade the database schema to the latest version"""
+    with db.engine.begin() as connection:
+        version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+        if version == 0 and not inspect(connection).has_table("user"):
+            # Fresh database: create the current schema directly
+            db.metadata.create_all(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {len(MIGRATIONS)}")
+            return
+
+    for number in range(version, len(MIGRATIONS)):
+        with db.engine.begin() as connection:
+            MIGRATIONS[number](connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {number + 1}")
+        print(f"Applied migration {number + 1}: {MIGRATIONS[number].__name__}")
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Upgrade the database schema"""
+    migrate_database()
+
+
+@app.cli.command("prune-images")
+def prune_images_command():
+    """Delete stored profile images that no profile refers to"""
+    print(f"Deleted {prune_images()} unreferenced images")
+
+
+@app.cli.command("reconcile-skill-counts")
+def reconcile_skill_counts_command():
+    """Recount skill.mentor_count from mentor_skill"""
+    print(f"Corrected mentor counts for {reconcile_skill_counts()} skills")
+
+
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
+        migrate_database()
+        skill_index.load()
 
     app.run(host="0.0.0.0", port=8080, debug=True)
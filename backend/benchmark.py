@@ -0,0 +1,339 @@
+"""
+Micro-benchmarks for the Mentor-Mentee Matching Application backend
+Run from the backend directory: python benchmark.py <benchmark> [options]
+"""
+
+import argparse
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Benchmarks write to a scratch database, never instance/mentor_mentee.db
+os.environ.setdefault(
+    "SQLALCHEMY_DATABASE_URI",
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}",
+)
+
+from PIL import Image  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+
+import app as app_module  # noqa: E402
+from app import (  # noqa: E402
+    MentorSkill,
+    User,
+    app,
+    create_jwt_token,
+    db,
+    hash_password,
+    matching_skill_ids,
+    set_mentor_skills,
+    set_profile_image,
+    shutdown_password_hasher,
+    skill_index,
+    thumbnail_cache,
+)
+
+
+@event.listens_for(Engine, "connect")
+def _skip_fsync(dbapi_connection, connection_record):
+    """Keep disk flushes out of the timings; the scratch database is disposable"""
+    dbapi_connection.execute("PRAGMA synchronous = OFF")
+
+
+def reset_database():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_password_hashing(args):
+    """Password hashes/sec, in total and per core, for each executor type"""
+    cores = os.cpu_count() or 1
+    print(f"method={args.method} hashes={args.count} cores={cores}")
+
+    for executor in ("thread", "process"):
+        app.config.update(
+            PASSWORD_HASH_METHOD=args.method,
+            PASSWORD_HASH_EXECUTOR=executor,
+            PASSWORD_HASH_WORKERS=cores,
+            PASSWORD_HASH_QUEUE_SIZE=args.count,
+        )
+        shutdown_password_hasher()
+        hash_password("warm-up")  # start the pool outside the timing
+
+        # Twice as many concurrent "request threads" as workers
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=cores * 2) as clients:
+            list(clients.map(hash_password, ["password123"] * args.count))
+        elapsed = time.perf_counter() - start
+
+        rate = args.count / elapsed
+        print(
+            f"{executor:>8}: {rate:8.1f} hashes/sec, {rate / cores:8.1f} per core"
+        )
+
+    shutdown_password_hasher()
+
+
+def bench_signup(args):
+    """Signup latency for each email deliverability mode"""
+    # Keep hashing cheap so the numbers show validation cost
+    app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:1000"
+    print(f"domain={args.domain} signups={args.count} (latency in ms)")
+
+    # Rejected signups skip the DNS wait and the insert, so the timings only
+    # mean something for a domain that is deliverable from here
+    if app_module.check_email_domain(args.domain) is False:
+        raise SystemExit(
+            f"{args.domain} is not deliverable from this machine "
+            "(no DNS?); pick another --domain"
+        )
+
+    for mode in ("off", "async", "sync"):
+        reset_database()
+        app_module._email_domain_cache.clear()
+        app.config["EMAIL_DELIVERABILITY_CHECK"] = mode
+
+        latencies, rejected = [], 0
+        with app.test_client() as client:
+            for i in range(args.count):
+                start = time.perf_counter()
+                response = client.post(
+                    "/api/signup",
+                    json={
+                        "email": f"user{i}@{args.domain}",
+                        "password": "password123",
+                        "name": "Benchmark",
+                        "role": "mentee",
+                    },
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                rejected += response.status_code != 201
+
+        # The first signup pays for an uncached DNS lookup in sync mode
+        first, rest = latencies[0], latencies[1:] or latencies
+        print(
+            f"{mode:>6}: first {first:7.2f}  median {statistics.median(rest):7.2f}"
+            f"  p95 {percentile(rest, 0.95):7.2f}  rejected {rejected}"
+        )
+        if mode == "sync" and rejected:
+            print(
+                f"warning: sync mode rejected {args.domain}; these numbers "
+                "time the rejection path, not the lookup"
+            )
+        else:
+            assert rejected == 0, f"{rejected} signups rejected in {mode} mode"
+
+
+def bench_skill_filter(args):
+    """Skill index lookups: AND/OR filters vs SQL joins, and autocomplete"""
+    reset_database()
+    skill_index.reset()
+    pool = [f"Skill {n:04d}" for n in range(args.skills)]
+    rng = random.Random(0)
+    with app.app_context():
+        for i in range(args.mentors):
+            user = User(email=f"m{i}@example.com", password_hash="x", role="mentor")
+            db.session.add(user)
+            db.session.flush()
+            set_mentor_skills(user, rng.sample(pool, 5))
+        db.session.commit()
+
+        start = time.perf_counter()
+        skill_index.load()
+        print(
+            f"mentors={args.mentors} skills={args.skills} "
+            f"index built in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+
+        groups = [matching_skill_ids(name) for name in pool[:2]]
+        ids = [skill_ids[0] for skill_ids in groups]
+
+        def sql_lookup(match_all):
+            # One EXISTS join per skill, combined with AND/OR
+            clauses = [
+                db.exists().where(
+                    MentorSkill.user_id == User.id, MentorSkill.skill_id == skill_id
+                )
+                for skill_id in ids
+            ]
+            condition = db.and_(*clauses) if match_all else db.or_(*clauses)
+            query = db.session.query(User.id).filter(condition)
+            return [user_id for (user_id,) in query]
+
+        for label, match_all in (("all", True), ("any", False)):
+            assert skill_index.mentors(groups, match_all) == sorted(
+                sql_lookup(match_all)
+            )
+            for name, lookup in (
+                ("index", lambda: skill_index.mentors(groups, match_all)),
+                ("sql", lambda: sql_lookup(match_all)),
+            ):
+                samples = []
+                for _ in range(args.count):
+                    start = time.perf_counter()
+                    lookup()
+                    samples.append((time.perf_counter() - start) * 1e6)
+                print(
+                    f"match={label:<3} {name:>5}: median "
+                    f"{statistics.median(samples):9.1f} us  "
+                    f"p95 {percentile(samples, 0.95):9.1f} us"
+                )
+
+        for prefix in ("s", "skill 00", "skill 0042"):
+            samples = []
+            for _ in range(args.count):
+                start = time.perf_counter()
+                skill_index.suggest(prefix, 10)
+                samples.append((time.perf_counter() - start) * 1e6)
+            print(
+                f"suggest {prefix!r:>12}: median "
+                f"{statistics.median(samples):9.1f} us  "
+                f"p95 {percentile(samples, 0.95):9.1f} us"
+            )
+
+
+def bench_request_creation(args):
+    """Match-request creation throughput and statements per request"""
+    reset_database()
+    with app.app_context():
+        users = [
+            User(email=f"{role}{i}@example.com", password_hash="x", role=role)
+            for role in ("mentor", "mentee")
+            for i in range(args.count)
+        ]
+        db.session.add_all(users)
+        db.session.commit()
+        with app.test_request_context():
+            tokens = {user.id: create_jwt_token(user) for user in users}
+        mentor_ids = [user.id for user in users if user.role == "mentor"]
+        mentee_ids = [user.id for user in users if user.role == "mentee"]
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", count_statement)
+    print(f"requests={args.count} per phase")
+    with app.test_client() as client:
+        # Every mentee asks one mentor, then asks again and is turned away
+        for phase, expected in (("created", 200), ("duplicate", 400)):
+            del statements[:]
+            statuses = []
+            start = time.perf_counter()
+            for mentee_id, mentor_id in zip(mentee_ids, mentor_ids):
+                response = client.post(
+                    "/api/match-requests",
+                    json={"mentorId": mentor_id, "message": "Hi"},
+                    headers={"Authorization": f"Bearer {tokens[mentee_id]}"},
+                )
+                statuses.append(response.status_code)
+            elapsed = time.perf_counter() - start
+            assert set(statuses) == {expected}, set(statuses)
+            print(
+                f"{phase:>9}: {args.count / elapsed:8.1f} requests/sec  "
+                f"{len(statements) / args.count:4.1f} statements/request"
+            )
+    event.remove(Engine, "before_cursor_execute", count_statement)
+
+
+def sample_photo(seed):
+    """A 1000x1000 JPEG with photo-like detail, different for each seed"""
+    x = (seed % 7) / 10
+    detail = Image.effect_mandelbrot((1000, 1000), (-2 + x, -1.2, 0.6 + x, 1.2), 64)
+    noise = Image.effect_noise((1000, 1000), 24)
+    channels = [detail, noise, Image.blend(detail, noise, 0.3 + seed % 5 / 10)]
+    buffer = io.BytesIO()
+    Image.merge("RGB", channels).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def bench_thumbnails(args):
+    """Image bytes per mentor-list render, full size vs ?size= thumbnails"""
+    reset_database()
+    app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+    thumbnail_cache.reset()
+    with app.app_context():
+        for i in range(args.mentors):
+            user = User(email=f"m{i}@example.com", password_hash="x", role="mentor")
+            db.session.add(user)
+            db.session.flush()
+            set_profile_image(user, sample_photo(i))
+        db.session.commit()
+        with app.test_request_context():
+            token = create_jwt_token(user)
+
+    with app.test_client() as client:
+        mentors = client.get(
+            "/api/mentors", headers={"Authorization": f"Bearer {token}"}
+        ).get_json()
+        urls = [mentor["profile"]["imageUrl"] for mentor in mentors]
+
+        def render(size=None):
+            """Fetch every avatar once; returns (bytes, milliseconds)"""
+            total, start = 0, time.perf_counter()
+            for url in urls:
+                response = client.get(url + (f"&size={size}" if size else ""))
+                assert response.status_code == 200, response.status_code
+                total += len(response.data)
+            return total, (time.perf_counter() - start) * 1000
+
+        full, full_ms = render()
+        print(f"mentors={len(urls)}  full size: {full / 1024:8.1f} KiB/render")
+        for size in app.config["THUMBNAIL_SIZES"]:
+            _, cold_ms = render(size)
+            thumbnails, warm_ms = render(size)
+            print(
+                f"size={size:<4} {thumbnails / 1024:8.1f} KiB/render "
+                f"({1 - thumbnails / full:6.1%} saved, "
+                f"{(full - thumbnails) / len(urls) / 1024:6.1f} KiB per mentor)  "
+                f"first render {cold_ms:7.1f} ms, then {warm_ms:6.1f} ms "
+                f"(full size {full_ms:6.1f} ms)"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    hashing = subparsers.add_parser("hashing", help=bench_password_hashing.__doc__)
+    hashing.add_argument("--method", default=app.config["PASSWORD_HASH_METHOD"])
+    hashing.add_argument("--count", type=int, default=50)
+    hashing.set_defaults(run=bench_password_hashing)
+
+    signup = subparsers.add_parser("signup", help=bench_signup.__doc__)
+    signup.add_argument("--domain", default="gmail.com")
+    signup.add_argument("--count", type=int, default=200)
+    signup.set_defaults(run=bench_signup)
+
+    skills = subparsers.add_parser("skills", help=bench_skill_filter.__doc__)
+    skills.add_argument("--mentors", type=int, default=5000)
+    skills.add_argument("--skills", type=int, default=200)
+    skills.add_argument("--count", type=int, default=200)
+    skills.set_defaults(run=bench_skill_filter)
+
+    requests = subparsers.add_parser("requests", help=bench_request_creation.__doc__)
+    requests.add_argument("--count", type=int, default=2000)
+    requests.set_defaults(run=bench_request_creation)
+
+    thumbnails = subparsers.add_parser("thumbnails", help=bench_thumbnails.__doc__)
+    thumbnails.add_argument("--mentors", type=int, default=20)
+    thumbnails.set_defaults(run=bench_thumbnails)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Shared pytest setup for the backend test suite.
+
+Points the app at a throwaway SQLite file before ``app`` is imported, so
+running the tests never touches instance/mentor_mentee.db.
+"""
+
+import os
+import tempfile
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_test_db_dir = tempfile.mkdtemp(prefix="mentor-mentee-tests-")
+os.environ.setdefault(
+    "SQLALCHEMY_DATABASE_URI",
+    f"sqlite:///{os.path.join(_test_db_dir, 'test.db')}",
+)
+
+
+@event.listens_for(Engine, "connect")
+def _skip_fsync(dbapi_connection, connection_record):
+    """The test database is disposable, so don't wait on fsync per commit"""
+    dbapi_connection.execute("PRAGMA synchronous = OFF")
@@ -2,7 +2,7 @@ import pytest
 import json
 import tempfile
 import os
-from app import app, db, User, MentorSkill, MatchingRequest
+from app import app, db, User, MatchingRequest, set_mentor_skills
 from werkzeug.security import generate_password_hash
 
 
@@ -231,10 +231,7 @@ class TestMentorListing:
     ):
         """Test getting mentor list as mentee"""
         # Add skills to mentor
-        skill1 = MentorSkill(user_id=mentor_user.id, skill="Python")
-        skill2 = MentorSkill(user_id=mentor_user.id, skill="React")
-        db.session.add(skill1)
-        db.session.add(skill2)
+        set_mentor_skills(mentor_user, ["Python", "React"])
         db.session.commit()
 
         response = client.get("/api/mentors", headers=auth_headers_mentee)
@@ -254,10 +251,7 @@ class TestMentorListing:
     ):
         """Test getting mentors with skill filter"""
         # Add skills to mentor
-        skill1 = MentorSkill(user_id=mentor_user.id, skill="Python")
-        skill2 = MentorSkill(user_id=mentor_user.id, skill="JavaScript")
-        db.session.add(skill1)
-        db.session.add(skill2)
+        set_mentor_skills(mentor_user, ["Python", "JavaScript"])
         db.session.commit()
 
         response = client.get("/api/mentors?skill=Python", headers=auth_headers_mentee)
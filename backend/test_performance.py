@@ -0,0 +1,2147 @@
+"""
+Performance regression tests for the Mentor-Mentee Matching Application API
+Guards query counts and index usage on the hot routes
+"""
+
+import base64
+import gzip
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import pytest
+import struct
+import threading
+import time
+import tracemalloc
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import yaml
+from PIL import Image, ImageCms
+import app as app_module
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import FileStorage
+from werkzeug.security import generate_password_hash
+from app import (
+    app,
+    db,
+    User,
+    MentorSkill,
+    MatchingRequest,
+    ProfileImage,
+    apply_keyset,
+    create_jwt_token,
+    image_path,
+    prune_images,
+    ResponseCache,
+    Skill,
+    mentor_directory_cache,
+    mentor_name_sort_key,
+    migrate_database,
+    revoke_user_tokens,
+    run_hashing_job,
+    set_mentor_skills,
+    set_profile_image,
+    skill_index,
+    shutdown_password_hasher,
+    store_image,
+    thumbnail_cache,
+    validate_image,
+)
+
+# Schema as shipped before migrations existed
+LEGACY_SCHEMA = [
+    """CREATE TABLE user (
+        id INTEGER NOT NULL, email VARCHAR(120) NOT NULL,
+        password_hash VARCHAR(255) NOT NULL, role VARCHAR(10) NOT NULL,
+        name VARCHAR(100), bio TEXT, profile_image BLOB, created_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (email))""",
+    """CREATE TABLE mentor_skill (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL, skill VARCHAR(50) NOT NULL,
+        PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id))""",
+    """CREATE TABLE matching_request (
+        id INTEGER NOT NULL, mentor_id INTEGER NOT NULL, mentee_id INTEGER NOT NULL,
+        message TEXT, status VARCHAR(20), created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(mentor_id) REFERENCES user (id),
+        FOREIGN KEY(mentee_id) REFERENCES user (id))""",
+]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Create a test client backed by a freshly created schema"""
+    app.config["TESTING"] = True
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    mentor_directory_cache.invalidate()
+    skill_index.reset()
+    thumbnail_cache.reset()
+
+    with app.test_client() as client:
+        yield client
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def create_user(email, role, name, skills=(), bio=None):
+    """Insert a user directly and return its id"""
+    with app.app_context():
+        user = User(
+            email=email,
+            password_hash=generate_password_hash(
+                "password123", method="pbkdf2:sha256:1000"
+            ),
+            name=name,
+            role=role,
+            bio=bio,
+        )
+        db.session.add(user)
+        db.session.flush()
+        set_mentor_skills(user, skills)
+        db.session.commit()
+        if role == "mentor":
+            mentor_directory_cache.invalidate()
+        return user.id
+
+
+def auth_headers(user_id):
+    """Build an Authorization header without going through /api/login"""
+    with app.test_request_context():
+        token = create_jwt_token(db.session.get(User, user_id))
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def legacy_db(client):
+    """Replace the fresh schema with the pre-migration one"""
+    with app.app_context():
+        db.drop_all()
+        with db.engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql("PRAGMA user_version = 0")
+    yield client
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("DROP TABLE IF EXISTS user")
+            connection.exec_driver_sql("DROP TABLE IF EXISTS matching_request_archive")
+            connection.exec_driver_sql("PRAGMA user_version = 0")
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement executed inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+class TestMentorListingQueries:
+    """GET /api/mentors must not issue a query per mentor"""
+
+    def test_query_count_is_constant(self, client):
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        headers = auth_headers(mentee_id)
+
+        for i in range(3):
+            create_user(f"m{i}@test.com", "mentor", f"Mentor {i}", ["Python", "AWS"])
+        with count_queries() as few:
+            response = client.get("/api/mentors", headers=headers)
+        assert response.status_code == 200
+        assert len(response.get_json()) == 3
+
+        for i in range(3, 30):
+            create_user(f"m{i}@test.com", "mentor", f"Mentor {i}", ["React"])
+        with count_queries() as many:
+            response = client.get("/api/mentors", headers=headers)
+        assert response.status_code == 200
+        assert len(response.get_json()) == 30
+
+        assert len(many) == len(few) <= 2
+
+    def test_skill_filter_returns_each_mentor_once(self, client):
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        create_user("m1@test.com", "mentor", "Alice", ["Python", "Python Django"])
+        create_user("m2@test.com", "mentor", "Bob", ["React"])
+        headers = auth_headers(mentee_id)
+        with app.app_context():
+            skill_index.load()  # done at startup
+
+        with count_queries() as statements:
+            response = client.get("/api/mentors?skill=python", headers=headers)
+
+        mentors = response.get_json()
+        assert [m["profile"]["name"] for m in mentors] == ["Alice"]
+        assert mentors[0]["profile"]["skills"] == ["Python", "Python Django"]
+        # skill ids, mentors, their skills
+        assert len(statements) <= 3
+
+
+class TestRequestListQueries:
+    """GET /api/requests must not look up the counterpart user per row"""
+
+    def _create_requests(self, mentee_ids, mentor_ids):
+        with app.app_context():
+            for mentee_id in mentee_ids:
+                for mentor_id in mentor_ids:
+                    # Only one request per mentee may be pending
+                    db.session.add(
+                        MatchingRequest(
+                            mentor_id=mentor_id,
+                            mentee_id=mentee_id,
+                            message="Hi",
+                            status="rejected",
+                        )
+                    )
+            db.session.commit()
+
+    def test_mentee_view_query_count_is_constant(self, client):
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        headers = auth_headers(mentee_id)
+        mentor_ids = [
+            create_user(f"m{i}@test.com", "mentor", f"Mentor {i}", ["Python", "AWS"])
+            for i in range(20)
+        ]
+
+        self._create_requests([mentee_id], mentor_ids[:2])
+        with count_queries() as few:
+            response = client.get("/api/requests", headers=headers)
+        assert len(response.get_json()) == 2
+
+        self._create_requests([mentee_id], mentor_ids[2:])
+        with count_queries() as many:
+            response = client.get("/api/requests", headers=headers)
+
+        requests = response.get_json()
+        assert len(requests) == 20
+        assert requests[0]["mentor"]["skills"] == ["Python", "AWS"]
+        assert set(requests[0]["mentor"]) == {"id", "name", "bio", "imageUrl", "skills"}
+        assert len(many) == len(few) <= 3
+
+    def test_mentor_view_query_count_is_constant(self, client):
+        mentor_id = create_user("mentor@test.com", "mentor", "Mentor", ["Go"])
+        headers = auth_headers(mentor_id)
+        mentee_ids = [
+            create_user(f"e{i}@test.com", "mentee", f"Mentee {i}") for i in range(20)
+        ]
+
+        self._create_requests(mentee_ids[:2], [mentor_id])
+        with count_queries() as few:
+            response = client.get("/api/requests", headers=headers)
+        assert len(response.get_json()) == 2
+
+        self._create_requests(mentee_ids[2:], [mentor_id])
+        with count_queries() as many:
+            response = client.get("/api/requests", headers=headers)
+
+        requests = response.get_json()
+        assert len(requests) == 20
+        assert requests[0]["mentee"]["name"] == "Mentee 0"
+        image_url = requests[0]["mentee"]["imageUrl"]
+        assert image_url == f"/api/images/mentee/{mentee_ids[0]}"
+        assert len(many) == len(few) <= 2
+
+
+def jpeg_bytes(size=500, color="red"):
+    """A valid square JPEG upload"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (size, size), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def upload_image(user_id, image_data):
+    """Set a user's profile image; returns the stored JPEG's hash"""
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        set_profile_image(user, image_data)
+        db.session.commit()
+        return user.profile_image.sha256
+
+
+def stored_bytes(digest):
+    with open(image_path(digest), "rb") as stored:
+        return stored.read()
+
+
+class TestProfileImageStorage:
+    """Image bytes live in a content-addressed file store, not the database"""
+
+    def test_store_does_not_follow_working_directory(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        store = os.path.join(app.root_path, "uploads")
+        assert image_path("ab" * 32).startswith(store + os.sep)
+
+    def test_images_are_served_from_the_store(self, client):
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        digest = upload_image(mentee_id, jpeg_bytes())
+        headers = auth_headers(mentee_id)
+
+        with count_queries() as statements:
+            client.get("/api/me", headers=headers)
+        assert len(statements) == 1  # the image hash comes with the user row
+
+        with count_queries() as statements:
+            response = client.get(f"/api/images/mentee/{mentee_id}")
+        assert response.status_code == 200
+        assert response.data == stored_bytes(digest)
+        assert len(statements) == 1 and "profile_image.sha256" in statements[0]
+        response.close()
+
+        # Wrong role falls back to the placeholder
+        response = client.get(f"/api/images/mentor/{mentee_id}")
+        assert response.status_code == 302
+
+    def test_identical_uploads_share_one_file(self, client):
+        user_ids = [create_user(f"e{i}@test.com", "mentee", "E") for i in range(2)]
+        shared = [upload_image(user_id, jpeg_bytes()) for user_id in user_ids]
+        assert shared[0] == shared[1]
+        upload_image(user_ids[0], jpeg_bytes(color="blue"))
+
+        with app.app_context():
+            images = [db.session.get(ProfileImage, i) for i in user_ids]
+            assert images[1].sha256 == shared[1]
+            digests = [image.sha256 for image in images]
+            referenced = {d for i in images for d in (i.sha256, i.webp_sha256)}
+            stored = [
+                name for _, _, names in os.walk(app.config["UPLOAD_FOLDER"])
+                for name in names
+            ]
+            assert sorted(stored) == sorted(referenced)
+
+            # Only files nothing refers to are pruned
+            orphan = store_image(b"orphan")
+            assert prune_images() == 0  # still in its grace period
+            assert prune_images(grace_seconds=-1) == 1
+            assert not os.path.exists(image_path(orphan))
+            assert all(os.path.exists(image_path(d)) for d in digests)
+
+    def test_proxy_can_send_the_file(self, client, monkeypatch):
+        mentor_id = create_user("mentor@test.com", "mentor", "Mentor")
+        digest = upload_image(mentor_id, jpeg_bytes())
+
+        monkeypatch.setitem(app.config, "IMAGE_ACCEL_REDIRECT", "/protected/")
+        response = client.get(f"/api/images/mentor/{mentor_id}")
+        assert response.headers["X-Accel-Redirect"] == (
+            f"/protected/{digest[:2]}/{digest}"
+        )
+        assert response.mimetype == "image/jpeg"
+        assert response.data == b""
+
+        monkeypatch.setitem(app.config, "IMAGE_ACCEL_REDIRECT", None)
+        monkeypatch.setitem(app.config, "USE_X_SENDFILE", True)
+        response = client.get(f"/api/images/mentor/{mentor_id}")
+        assert response.headers["X-Sendfile"] == image_path(digest)
+        assert response.data == b""
+
+    def test_migration_moves_blobs_out_of_the_database(self, legacy_db):
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    "INSERT INTO user (id, email, password_hash, role, profile_image) "
+                    "VALUES (1, 'a@test.com', 'x', 'mentor', x'ffd8ff'), "
+                    "(2, 'b@test.com', 'x', 'mentee', NULL), "
+                    "(3, 'c@test.com', 'x', 'mentee', x'ffd8ff')"
+                )
+
+            migrate_database()
+
+            with db.engine.connect() as connection:
+                columns = [c["name"] for c in inspect(connection).get_columns("user")]
+                version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+            assert "profile_image" not in columns
+            assert version > 0
+
+            indexes = inspect(db.engine).get_indexes("matching_request")
+            indexes = {index["name"] for index in indexes}
+            assert "ix_matching_request_mentor_feed" in indexes
+            assert "ix_matching_request_mentor_status" not in indexes
+
+            digest = hashlib.sha256(b"\xff\xd8\xff").hexdigest()
+            images = db.session.query(ProfileImage.user_id, ProfileImage.sha256)
+            assert images.order_by(ProfileImage.user_id).all() == [
+                (1, digest),
+                (3, digest),
+            ]
+            assert stored_bytes(digest) == b"\xff\xd8\xff"
+            columns = inspect(db.engine).get_columns("profile_image")
+            assert "data" not in {column["name"] for column in columns}
+
+            # Running again is a no-op
+            migrate_database()
+
+
+class TestProfileImageCaching:
+    """Image responses carry hash ETags; versioned imageUrls are immutable"""
+
+    def test_versioned_url_is_immutable(self, client):
+        mentor_id = create_user("mentor@test.com", "mentor", "Mentor")
+        digest = upload_image(mentor_id, jpeg_bytes())
+        headers = auth_headers(mentor_id)
+
+        mentors = client.get("/api/mentors", headers=headers).get_json()
+        url = mentors[0]["profile"]["imageUrl"]
+        assert url == f"/api/images/mentor/{mentor_id}?v={digest[:16]}"
+        me = client.get("/api/me", headers=headers).get_json()
+        assert me["profile"]["imageUrl"] == url
+
+        response = client.get(url)
+        assert response.data == stored_bytes(digest)
+        assert response.headers["ETag"] == f'"{digest}"'
+        cache_control = response.cache_control
+        assert cache_control.immutable and cache_control.public
+        assert cache_control.max_age == 365 * 24 * 3600
+        assert not cache_control.no_cache
+
+        # Compressing proxies weaken ETags; If-None-Match still matches
+        response = client.get(url, headers={"If-None-Match": f'W/"{digest}"'})
+        assert response.status_code == 304
+
+        # Unversioned and outdated URLs must be revalidated
+        for stale in (f"/api/images/mentor/{mentor_id}", url[:-1] + "x"):
+            response = client.get(stale)
+            assert response.data == stored_bytes(digest)
+            assert response.cache_control.no_cache
+            assert not response.cache_control.immutable
+
+        # A matching ETag is answered without opening the file
+        with app.app_context():
+            os.remove(image_path(digest))
+        with count_queries() as statements:
+            response = client.get(url, headers={"If-None-Match": f'"{digest}"'})
+        assert response.status_code == 304
+        assert response.data == b""
+        assert response.headers["ETag"] == f'"{digest}"'
+        assert response.cache_control.immutable
+        assert len(statements) == 1
+
+    def test_upload_changes_listed_urls(self, client):
+        mentor_id = create_user("mentor@test.com", "mentor", "Mentor")
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        mentee_headers = auth_headers(mentee_id)
+        with app.app_context():
+            db.session.add(MatchingRequest(mentor_id=mentor_id, mentee_id=mentee_id))
+            db.session.commit()
+
+        def mentor_url():
+            mentors = client.get("/api/mentors", headers=mentee_headers).get_json()
+            return mentors[0]["profile"]["imageUrl"]
+
+        assert mentor_url() == f"/api/images/mentor/{mentor_id}"
+        incoming = client.get("/api/requests", headers=auth_headers(mentor_id))
+        assert incoming.get_json()[0]["mentee"]["imageUrl"] == (
+            f"/api/images/mentee/{mentee_id}"
+        )
+
+        for color in ("red", "blue"):
+            image = jpeg_bytes(color=color)
+            response = client.put(
+                f"/api/images/mentor/{mentor_id}",
+                data={"image": (io.BytesIO(image), "me.jpg")},
+                headers=auth_headers(mentor_id),
+            )
+            assert response.status_code == 200
+            with app.app_context():
+                version = db.session.get(ProfileImage, mentor_id).sha256[:16]
+            assert mentor_url() == f"/api/images/mentor/{mentor_id}?v={version}"
+            outgoing = client.get("/api/requests", headers=mentee_headers)
+            assert outgoing.get_json()[0]["mentor"]["imageUrl"] == mentor_url()
+
+
+def _crashing_thumbnail_worker(*args):
+    """Stands in for make_thumbnail in a worker that dies, e.g. OOM-killed"""
+    os._exit(1)
+
+
+def _failing_thumbnail_worker(*args):
+    raise OSError("image file is truncated")
+
+
+class TestProfileImageThumbnails:
+    """?size= serves cached thumbnails made once each in a process pool"""
+
+    @pytest.fixture
+    def mentor(self, client):
+        mentor_id = create_user("mentor@test.com", "mentor", "Mentor")
+        return mentor_id, upload_image(mentor_id, jpeg_bytes(size=1000))
+
+    def test_thumbnail_is_resized_and_immutable(self, client, mentor):
+        mentor_id, digest = mentor
+        url = f"/api/images/mentor/{mentor_id}?v={digest[:16]}&size=64"
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert Image.open(io.BytesIO(response.data)).size == (64, 64)
+        assert response.headers["ETag"] == f'"{digest}-64"'
+        assert response.cache_control.immutable
+
+        response = client.get(url, headers={"If-None-Match": f'"{digest}-64"'})
+        assert response.status_code == 304
+        response = client.get(f"/api/images/mentor/{mentor_id}?size=65")
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("validator", ['"{}-128"', 'W/"{}-128"'])
+    def test_revalidation_does_not_make_a_thumbnail(self, client, mentor, validator):
+        mentor_id, digest = mentor
+        response = client.get(
+            f"/api/images/mentor/{mentor_id}?size=128",
+            headers={"If-None-Match": validator.format(digest)},
+        )
+        assert response.status_code == 304
+        assert not os.path.exists(thumbnail_cache.path(digest, 128))
+
+    def test_concurrent_requests_share_one_job(self, client, mentor, monkeypatch):
+        mentor_id, digest = mentor
+        jobs = []
+
+        class CountingExecutor(ThreadPoolExecutor):
+            def submit(self, function, *args):
+                jobs.append(args)
+                return super().submit(function, *args)
+
+        monkeypatch.setattr(thumbnail_cache, "_executor", CountingExecutor())
+        barrier = threading.Barrier(6)
+        bodies = []
+
+        def fetch():
+            with app.test_client() as thread_client:
+                barrier.wait()
+                response = thread_client.get(f"/api/images/mentor/{mentor_id}?size=256")
+                bodies.append(response.data)
+
+        threads = [threading.Thread(target=fetch) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(jobs) == 1
+        assert len(set(bodies)) == 1
+        assert Image.open(io.BytesIO(bodies[0])).size == (256, 256)
+
+    def test_least_recently_used_thumbnails_are_evicted(
+        self, client, mentor, monkeypatch
+    ):
+        mentor_id, digest = mentor
+        url = f"/api/images/mentor/{mentor_id}?size="
+        evictions = thumbnail_cache.evictions
+        client.get(url + "64")
+        small = os.path.getsize(thumbnail_cache.path(digest, 64))
+        monkeypatch.setitem(app.config, "THUMBNAIL_CACHE_MAX_BYTES", small + 1)
+
+        assert client.get(url + "128").status_code == 200
+        assert not os.path.exists(thumbnail_cache.path(digest, 64))
+        assert os.path.exists(thumbnail_cache.path(digest, 128))
+        assert thumbnail_cache.evictions == evictions + 1
+
+        # After a restart the cache picks up what is on disk
+        thumbnail_cache.reset()
+        monkeypatch.setitem(app.config, "THUMBNAIL_CACHE_MAX_BYTES", 1)
+        client.get(url + "256")
+        assert thumbnail_cache.evictions == evictions + 2
+        assert not os.path.exists(thumbnail_cache.path(digest, 128))
+
+    @pytest.mark.parametrize(
+        "worker", [_crashing_thumbnail_worker, _failing_thumbnail_worker]
+    )
+    def test_failed_thumbnail_falls_back_and_recovers(
+        self, client, mentor, monkeypatch, worker
+    ):
+        mentor_id, digest = mentor
+        url = f"/api/images/mentor/{mentor_id}?v={digest[:16]}&size=64"
+
+        with monkeypatch.context() as patch:
+            patch.setattr(app_module, "make_thumbnail", worker)
+            response = client.get(url)
+        assert response.status_code == 200
+        assert Image.open(io.BytesIO(response.data)).size == (1000, 1000)
+        assert response.headers["ETag"] == f'"{digest}"'
+        assert response.cache_control.no_cache
+        assert thumbnail_cache._in_flight == {}
+
+        # A dead worker broke the pool; the next request gets a new one
+        response = client.get(url)
+        assert Image.open(io.BytesIO(response.data)).size == (64, 64)
+        assert response.headers["ETag"] == f'"{digest}-64"'
+
+    def test_slow_thumbnail_falls_back_to_the_original(
+        self, client, mentor, monkeypatch
+    ):
+        mentor_id, digest = mentor
+
+        class StuckExecutor:
+            def submit(self, function, *args):
+                return Future()  # never finishes
+
+        monkeypatch.setattr(thumbnail_cache, "_executor", StuckExecutor())
+        monkeypatch.setitem(app.config, "THUMBNAIL_TIMEOUT", 0.01)
+        response = client.get(f"/api/images/mentor/{mentor_id}?v={digest[:16]}&size=64")
+        assert response.status_code == 200
+        assert Image.open(io.BytesIO(response.data)).size == (1000, 1000)
+        assert response.headers["ETag"] == f'"{digest}"'
+        assert response.cache_control.no_cache
+
+
+class TestProfileImageFormats:
+    """Uploads are re-encoded without metadata; Accept picks JPEG or WebP"""
+
+    def test_upload_is_reencoded_without_metadata(self, client):
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+        exif[0x010F] = "Camera Maker"
+        icc_profile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+        buffer = io.BytesIO()
+        Image.new("RGB", (40, 20), "red").save(
+            buffer, "JPEG", exif=exif, icc_profile=icc_profile.tobytes()
+        )
+
+        digest = upload_image(mentee_id, buffer.getvalue())
+        with app.app_context():
+            webp_digest = db.session.get(ProfileImage, mentee_id).webp_sha256
+        for stored_digest, image_format in [(digest, "JPEG"), (webp_digest, "WEBP")]:
+            with Image.open(image_path(stored_digest)) as stored:
+                assert stored.format == image_format
+                assert stored.size == (20, 40)
+                assert "exif" not in stored.info
+                assert "icc_profile" not in stored.info
+                if image_format == "JPEG":
+                    assert stored.info.get("progressive")
+
+    def test_transparent_png_becomes_white(self, client):
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        buffer = io.BytesIO()
+        Image.new("RGBA", (10, 10), (0, 0, 0, 0)).save(buffer, "PNG")
+
+        digest = upload_image(mentee_id, buffer.getvalue())
+        with Image.open(image_path(digest)) as stored:
+            assert all(channel > 250 for channel in stored.getpixel((5, 5)))
+
+        response = client.get(f"/api/images/mentee/{mentee_id}")
+        assert response.mimetype == "image/jpeg"
+
+    @pytest.mark.parametrize(
+        "accept, mimetype",
+        [
+            (None, "image/jpeg"),
+            ("*/*", "image/jpeg"),
+            ("image/avif,image/webp,*/*", "image/webp"),
+            ("image/webp;q=0.5,image/jpeg", "image/jpeg"),
+        ],
+    )
+    def test_format_follows_accept(self, client, accept, mimetype):
+        mentor_id = create_user("mentor@test.com", "mentor", "Mentor")
+        upload_image(mentor_id, jpeg_bytes())
+        headers = {"Accept": accept} if accept else {}
+
+        response = client.get(f"/api/images/mentor/{mentor_id}", headers=headers)
+        assert response.mimetype == mimetype
+        assert Image.open(io.BytesIO(response.data)).format == mimetype[6:].upper()
+        assert "Accept" in response.vary
+
+        etag = response.headers["ETag"]
+        headers["If-None-Match"] = etag
+        response = client.get(f"/api/images/mentor/{mentor_id}", headers=headers)
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert "Accept" in response.vary
+
+    def test_webp_can_be_turned_off(self, client, monkeypatch):
+        monkeypatch.setitem(app.config, "IMAGE_WEBP", False)
+        mentor_id = create_user("mentor@test.com", "mentor", "Mentor")
+        upload_image(mentor_id, jpeg_bytes())
+
+        response = client.get(
+            f"/api/images/mentor/{mentor_id}", headers={"Accept": "image/webp"}
+        )
+        assert response.mimetype == "image/jpeg"
+        assert "Accept" not in response.vary
+
+    def test_migration_records_real_content_types(self, legacy_db):
+        buffer = io.BytesIO()
+        Image.new("RGB", (10, 10), "blue").save(buffer, "PNG")
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    "INSERT INTO user (id, email, password_hash, role, profile_image) "
+                    "VALUES (1, 'a@test.com', 'x', 'mentor', ?), "
+                    "(2, 'b@test.com', 'x', 'mentor', ?)",
+                    (buffer.getvalue(), jpeg_bytes()),
+                )
+            migrate_database()
+
+            images = db.session.query(ProfileImage.user_id, ProfileImage.content_type)
+            assert images.order_by(ProfileImage.user_id).all() == [
+                (1, "image/png"),
+                (2, "image/jpeg"),
+            ]
+        response = legacy_db.get("/api/images/mentor/1")
+        assert response.mimetype == "image/png"
+        assert response.data == buffer.getvalue()
+
+
+def png_header(width, height):
+    """A PNG that claims the given dimensions but carries no pixel data"""
+
+    def chunk(kind, data):
+        crc = zlib.crc32(kind + data)
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", ihdr)
+        + chunk(b"IDAT", zlib.compress(b""))
+        + chunk(b"IEND", b"")
+    )
+
+
+def noise_jpeg(size):
+    """A square JPEG that compresses poorly, so the file is large"""
+    buffer = io.BytesIO()
+    Image.effect_noise((size, size), 64).convert("RGB").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def traced_peak(function, *args):
+    """Run function; returns (result, peak bytes of Python allocations)"""
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class TestImageValidation:
+    """Uploads are validated from their headers, before any pixels are decoded"""
+
+    @pytest.mark.parametrize(
+        "image_data, filename, expected",
+        [
+            (jpeg_bytes(), "small.jpg", "Valid image"),
+            (noise_jpeg(1000), "large.jpg", "Valid image"),
+            (png_header(1000, 1000), "header.png", "Valid image"),
+            (png_header(1200, 1200), "big.png", "between 500x500 and 1000x1000"),
+            (png_header(60000, 60000), "bomb.png", "between 500x500 and 1000x1000"),
+            (png_header(800, 600), "wide.png", "Image must be square"),
+        ],
+    )
+    def test_validation_memory_does_not_grow_with_image(
+        self, image_data, filename, expected
+    ):
+        file = FileStorage(io.BytesIO(image_data), filename=filename)
+        validate_image(file)  # warm up Pillow's plugin imports
+
+        (is_valid, message), peak = traced_peak(validate_image, file)
+        assert expected in message
+        assert is_valid == (message == "Valid image")
+        assert peak < 64 * 1024
+        assert file.stream.tell() == 0
+
+    def test_oversized_file_is_rejected_unread(self, monkeypatch):
+        monkeypatch.setitem(app.config, "IMAGE_MAX_BYTES", 1000)
+        monkeypatch.setattr(app_module.Image, "open", None)  # must not be reached
+        file = FileStorage(io.BytesIO(jpeg_bytes()), filename="photo.jpg")
+        assert validate_image(file) == (False, "Image size must be less than 1MB")
+
+    def test_base64_size_is_checked_before_decoding(self, client, monkeypatch):
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        headers = auth_headers(mentee_id)
+        image_data = noise_jpeg(500)
+        monkeypatch.setitem(app.config, "IMAGE_MAX_BYTES", len(image_data) - 1)
+
+        decoded = []
+        b64decode = base64.b64decode
+
+        def record_decoding(data, *args, **kwargs):
+            decoded.append(len(data))  # JWTs are decoded here too
+            return b64decode(data, *args, **kwargs)
+
+        with monkeypatch.context() as patch:
+            patch.setattr(app_module.base64, "b64decode", record_decoding)
+            response = client.put(
+                "/api/profile",
+                json={"image": base64.b64encode(image_data).decode()},
+                headers=headers,
+            )
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Image size must be less than 1MB"
+        assert all(length < len(image_data) for length in decoded)
+
+        monkeypatch.setitem(app.config, "IMAGE_MAX_BYTES", len(image_data))
+        response = client.put(
+            "/api/profile",
+            json={"image": base64.b64encode(image_data).decode()},
+            headers=headers,
+        )
+        assert response.status_code == 200
+        with app.app_context():
+            assert db.session.get(ProfileImage, mentee_id) is not None
+
+    def test_truncated_upload_is_a_bad_request(self, client):
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        headers = auth_headers(mentee_id)
+        truncated = jpeg_bytes(600)[:1000]  # header intact, pixel data cut off
+
+        response = client.put(
+            f"/api/images/mentee/{mentee_id}",
+            data={"image": (io.BytesIO(truncated), "photo.jpg")},
+            headers=headers,
+        )
+        assert response.status_code == 400
+        assert response.get_json()["error"].startswith("Invalid image file")
+
+        response = client.put(
+            f"/api/images/mentee/{mentee_id}",
+            data={"image": (io.BytesIO(png_header(600, 600)), "photo.png")},
+            headers=headers,
+        )
+        assert response.status_code == 400
+        with app.app_context():
+            assert db.session.get(ProfileImage, mentee_id) is None
+
+    def test_bomb_is_not_decoded_when_stored(self, client):
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        with app.app_context():
+            user = db.session.get(User, mentee_id)
+            with pytest.raises(ValueError, match="too many pixels"):
+                set_profile_image(user, png_header(2000, 2000))
+
+
+def query_plan(query):
+    """Return SQLite's EXPLAIN QUERY PLAN details for an ORM query"""
+    sql = str(
+        query.statement.compile(
+            dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}
+        )
+    )
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return " | ".join(row[-1] for row in rows)
+
+
+class TestLookupIndexes:
+    """Hot lookups must be served by an index, not a table scan"""
+
+    @pytest.mark.parametrize(
+        "filters",
+        [
+            {"mentee_id": 1, "status": "pending"},
+            {"mentor_id": 1, "status": "accepted"},
+            {"mentor_id": 1, "mentee_id": 2},
+            {"mentor_id": 1},
+            {"mentee_id": 1},
+        ],
+    )
+    def test_matching_request_lookups_use_index(self, client, filters):
+        with app.app_context():
+            plan = query_plan(MatchingRequest.query.filter_by(**filters))
+        assert "USING INDEX" in plan or "USING COVERING INDEX" in plan, plan
+        assert "SCAN matching_request" not in plan, plan
+
+    @pytest.mark.parametrize("filters", [{"user_id": 1}, {"skill_id": 1}])
+    def test_mentor_skill_lookups_use_index(self, client, filters):
+        with app.app_context():
+            plan = query_plan(MentorSkill.query.filter_by(**filters))
+        assert "USING INDEX" in plan or "USING COVERING INDEX" in plan, plan
+
+
+class TestMentorSearch:
+    """Skill filter and q= search go through the mentor_search FTS5 index"""
+
+    def _mentors(self, client, headers, query):
+        response = client.get(f"/api/mentors?{query}", headers=headers)
+        assert response.status_code == 200
+        return [mentor["profile"]["name"] for mentor in response.get_json()]
+
+    def test_search_index_follows_profile_updates(self, client):
+        mentee_headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        mentor_id = create_user("m@test.com", "mentor", "Alice", ["Java"])
+        mentor_headers = auth_headers(mentor_id)
+
+        assert self._mentors(client, mentee_headers, "skill=java") == ["Alice"]
+
+        client.put(
+            "/api/profile",
+            json={"skills": ["Python", "React Native"], "bio": "Backend teacher"},
+            headers=mentor_headers,
+        )
+        assert self._mentors(client, mentee_headers, "skill=java") == []
+        assert self._mentors(client, mentee_headers, "skill=pyth") == ["Alice"]
+        assert self._mentors(client, mentee_headers, "skill=react+nat") == ["Alice"]
+        assert self._mentors(client, mentee_headers, "q=teach") == ["Alice"]
+
+        client.put("/api/me", json={"bio": "Frontend coach"}, headers=mentor_headers)
+        assert self._mentors(client, mentee_headers, "q=teach") == []
+        assert self._mentors(client, mentee_headers, "q=coach") == ["Alice"]
+
+    def test_search_is_ranked_and_multi_term(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        create_user("a@test.com", "mentor", "Alice", ["Go"], bio="Python hobbyist")
+        create_user("b@test.com", "mentor", "Bob", ["Python", "AWS"])
+        create_user("c@test.com", "mentor", "Carol", ["AWS"])
+
+        # Skill matches outweigh bio matches
+        assert self._mentors(client, headers, "q=python") == ["Bob", "Alice"]
+        assert self._mentors(client, headers, "q=python+aws") == ["Bob"]
+        assert self._mentors(client, headers, "q=python&sortBy=name") == [
+            "Alice",
+            "Bob",
+        ]
+        # FTS5 syntax in user input is treated as plain words
+        assert self._mentors(client, headers, 'skill="AWS" OR NEAR(') == []
+        assert self._mentors(client, headers, "skill=*") == []
+
+    def test_migration_backfills_search_index(self, legacy_db):
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    "INSERT INTO user (id, email, password_hash, role, bio) "
+                    "VALUES (1, 'a@test.com', 'x', 'mentor', 'Kotlin fan')"
+                )
+                connection.exec_driver_sql(
+                    "INSERT INTO mentor_skill (user_id, skill) VALUES (1, 'Swift')"
+                )
+            migrate_database()
+
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        response = legacy_db.get("/api/mentors?q=swift+kotlin", headers=headers)
+        assert [mentor["id"] for mentor in response.get_json()] == [1]
+
+
+class TestMentorPagination:
+    """limit/cursor keyset pagination on GET /api/mentors"""
+
+    def _walk(self, client, headers, query, limit):
+        names, cursor, pages = [], None, 0
+        while True:
+            url = f"/api/mentors?{query}&limit={limit}"
+            if cursor:
+                url += f"&cursor={cursor}"
+            response = client.get(url, headers=headers)
+            assert response.status_code == 200
+            page = response.get_json()
+            assert len(page) <= limit
+            names.extend(mentor["profile"]["name"] for mentor in page)
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return names, pages
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "sortBy=name&sortOrder=asc",
+            "sortBy=name&sortOrder=desc",
+            "sortBy=skill&sortOrder=asc",
+            "sortBy=skill&sortOrder=desc",
+            "q=python",
+        ],
+    )
+    def test_pages_cover_full_listing_in_order(self, client, query):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        # Duplicate names and skill lists exercise the id tie-breaker
+        for i in range(11):
+            create_user(
+                f"m{i}@test.com",
+                "mentor",
+                f"Mentor {i % 4}",
+                [["Python", "AWS"], ["Go"], ["Python"]][i % 3],
+            )
+
+        response = client.get(f"/api/mentors?{query}", headers=headers)
+        assert "X-Next-Cursor" not in response.headers
+        full = response.get_json()
+
+        names, pages = self._walk(client, headers, query, limit=3)
+        assert names == [mentor["profile"]["name"] for mentor in full]
+        assert pages == -(-len(full) // 3)
+
+    def test_skill_sort_orders_by_joined_skills(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        create_user("a@test.com", "mentor", "Alice", ["React", "AWS"])
+        create_user("b@test.com", "mentor", "Bob", ["Go"])
+        create_user("c@test.com", "mentor", "Carol", [])
+
+        response = client.get("/api/mentors?sortBy=skill", headers=headers)
+        names = [mentor["profile"]["name"] for mentor in response.get_json()]
+        assert names == ["Carol", "Bob", "Alice"]
+
+    def test_skill_sort_key_follows_profile_edits(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        alice = create_user("a@test.com", "mentor", "Alice", ["React"])
+        create_user("b@test.com", "mentor", "Bob", ["go"])
+
+        client.put(
+            "/api/profile",
+            json={"skills": [" Ansible", "Go"]},
+            headers=auth_headers(alice),
+        )
+        with app.app_context():
+            assert db.session.get(User, alice).skills_sort_key == "ansible, go"
+
+        response = client.get("/api/mentors?sortBy=skill", headers=headers)
+        names = [mentor["profile"]["name"] for mentor in response.get_json()]
+        assert names == ["Alice", "Bob"]
+
+    def test_deep_skill_page_seeks_the_index(self, client):
+        with app.app_context():
+            query = apply_keyset(
+                User.query.filter_by(role="mentor"),
+                User.skills_sort_key,
+                User.id,
+                False,
+                ["python", 10],
+            ).limit(20)
+            plan = query_plan(query)
+        assert "ix_user_role_skills" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+    def test_migration_backfills_skill_sort_key(self, legacy_db):
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    "INSERT INTO user (id, email, password_hash, role) "
+                    "VALUES (1, 'a@test.com', 'x', 'mentor'), "
+                    "(2, 'b@test.com', 'x', 'mentor')"
+                )
+                connection.exec_driver_sql(
+                    "INSERT INTO mentor_skill (user_id, skill) "
+                    "VALUES (1, 'Swift'), (1, 'Äpfel'), (2, 'AWS')"
+                )
+            migrate_database()
+
+            keys = db.session.query(User.id, User.skills_sort_key).order_by(User.id)
+            assert keys.all() == [(1, "swift, äpfel"), (2, "aws")]
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "limit=0",
+            "limit=101",
+            "limit=abc",
+            "limit=5&cursor=not-a-cursor",
+            # A name-ordered cursor cannot be replayed against skill order
+            "limit=5&sortBy=skill&cursor=WyJuYW1lOmFzYyIsIkJvYiIsM10",
+            # Right ordering, wrongly typed values: {"a": 1}, ["Bob"], null
+            # as the name, then "3" and true as the id
+            "limit=5&cursor=WyJuYW1lOmFzYyIseyJhIjoxfSwzXQ",
+            "limit=5&cursor=WyJuYW1lOmFzYyIsWyJCb2IiXSwzXQ",
+            "limit=5&cursor=WyJuYW1lOmFzYyIsbnVsbCwzXQ",
+            "limit=5&cursor=WyJuYW1lOmFzYyIsIkJvYiIsIjMiXQ",
+            "limit=5&cursor=WyJuYW1lOmFzYyIsIkJvYiIsdHJ1ZV0",
+        ],
+    )
+    def test_bad_pagination_parameters(self, client, query):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        response = client.get(f"/api/mentors?{query}", headers=headers)
+        assert response.status_code == 400
+
+    def test_deep_name_page_seeks_the_index(self, client):
+        with app.test_request_context():
+            query = apply_keyset(
+                User.query.filter_by(role="mentor"),
+                mentor_name_sort_key(),
+                User.id,
+                False,
+                ["Mentor 9000", 9000],
+            )
+            plan = query_plan(query.limit(21))
+        assert "ix_user_role_name (role=? AND <expr>>?)" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+
+class TestSkillDictionary:
+    """Skills are stored once in the skill table and linked by id"""
+
+    def test_skill_names_are_normalized_and_shared(self, client):
+        alice = create_user("a@test.com", "mentor", "Alice", ["Python", " React "])
+        bob = create_user("b@test.com", "mentor", "Bob", ["python", "PYTHON"])
+
+        with app.app_context():
+            skills = db.session.query(Skill.name, Skill.normalized_name)
+            assert sorted(skills) == [("Python", "python"), ("React", "react")]
+            links = db.session.query(MentorSkill.user_id, MentorSkill.skill_id)
+            assert sorted(links)[0][1] == sorted(links)[2][1]
+            assert db.session.get(User, bob).skills_sort_key == "python"
+
+        headers = auth_headers(alice)
+        response = client.get("/api/profile", headers=headers)
+        assert response.get_json()["skills"] == ["Python", "React"]
+
+    def test_skill_filter_joins_on_skill_ids(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        create_user("a@test.com", "mentor", "Alice", ["Python Django"])
+        create_user("b@test.com", "mentor", "Bob", ["Go"])
+        create_user("c@test.com", "mentor", "Carol", ["100% Uptime"])
+
+        def names(query):
+            response = client.get(f"/api/mentors?{query}", headers=headers)
+            return [mentor["profile"]["name"] for mentor in response.get_json()]
+
+        assert names("skill=DJANGO") == ["Alice"]
+        assert names("skill=python++dj") == ["Alice"]
+        assert names("skill=100%25") == ["Carol"]
+        assert names("skill=%25") == []
+        assert names("skill=_o") == []
+
+        with app.app_context(), count_queries() as statements:
+            with app.test_request_context("/api/mentors?skill=go"):
+                app_module.render_mentor_directory()
+        assert "matching_request" not in " ".join(statements)
+        mentors_query = [s for s in statements if "FROM user" in s][0]
+        assert "json_each" in mentors_query
+        assert "mentor_search" not in mentors_query
+
+    def test_multi_skill_filters_match_all_or_any(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        create_user("a@test.com", "mentor", "Alice", ["Python", "AWS"])
+        create_user("b@test.com", "mentor", "Bob", ["Python"])
+        create_user("c@test.com", "mentor", "Carol", ["AWS", "Go"])
+        create_user("d@test.com", "mentor", "Dan", ["Rust"])
+
+        def names(query):
+            response = client.get(f"/api/mentors?{query}", headers=headers)
+            assert response.status_code == 200
+            return [mentor["profile"]["name"] for mentor in response.get_json()]
+
+        assert names("skill=Python,AWS") == ["Alice"]
+        assert names("skill=Python,AWS&match=all") == ["Alice"]
+        assert names("skill=Python,AWS&match=any") == ["Alice", "Bob", "Carol"]
+        assert names("skill=python,+aws,&match=any") == ["Alice", "Bob", "Carol"]
+        assert names("skill=Python,Cobol") == []
+        assert names("skill=Python,Cobol&match=any") == ["Alice", "Bob"]
+        assert names("skill=,") == ["Alice", "Bob", "Carol", "Dan"]
+        assert names("skill=Python,AWS&match=any&sortBy=name&sortOrder=desc") == [
+            "Carol",
+            "Bob",
+            "Alice",
+        ]
+
+        response = client.get("/api/mentors?skill=Go&match=most", headers=headers)
+        assert response.status_code == 400
+
+    def test_skill_index_handles_large_sparse_ids(self):
+        # Lookups must not scale with the largest id, which a bitmap indexed
+        # by mentor id would (2**40 bits here)
+        index = app_module.SkillIndex()
+        index._loaded = True
+        index._add(2**40, 1, "Go")
+        index._add(2**40, 2, "Rust")
+        index._add(3, 2, "Rust")
+
+        assert index.mentors([[1], [2]], True) == [2**40]
+        assert index.mentors([[1], [2]], False) == [3, 2**40]
+        assert index.mentors([[1, 2]], True) == [3, 2**40]
+        index.update(2**40, [])
+        assert index.mentors([[1], [2]], False) == [3]
+        assert index.suggest("r", 10) == [("Rust", 1)]
+
+    def test_skill_index_follows_commits_without_reloading(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        alice = create_user("a@test.com", "mentor", "Alice", ["Python"])
+        with app.app_context():
+            skill_index.load()
+
+        client.put("/api/profile", json={"skills": ["Go"]}, headers=auth_headers(alice))
+        with app.app_context():
+            with count_queries() as statements:
+                go = app_module.matching_skill_ids("go")
+                python = app_module.matching_skill_ids("python")
+                assert skill_index.mentors([go], True) == [alice]
+                assert skill_index.mentors([python], True) == []
+        assert not any("mentor_skill" in statement for statement in statements)
+
+        # Changes rolled back never reach the index
+        with app.app_context():
+            user = db.session.get(User, alice)
+            set_mentor_skills(user, ["Python"])
+            db.session.rollback()
+            assert skill_index.mentors([python], True) == []
+
+        response = client.get("/api/mentors?skill=go", headers=headers)
+        assert [mentor["id"] for mentor in response.get_json()] == [alice]
+
+    def test_suggest_ranks_by_mentor_count(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        create_user("a@test.com", "mentor", "Alice", ["Python", "PyTorch"])
+        create_user("b@test.com", "mentor", "Bob", ["python", "Python Django"])
+        carol = create_user("c@test.com", "mentor", "Carol", ["PyTorch", "Go"])
+        create_user("d@test.com", "mentor", "Dan", ["Pyramid"])
+
+        def suggest(query):
+            response = client.get(f"/api/skills/suggest?{query}", headers=headers)
+            assert response.status_code == 200
+            return [(s["name"], s["mentors"]) for s in response.get_json()]
+
+        assert suggest("q=py") == [
+            ("PyTorch", 2),
+            ("Python", 2),
+            ("Pyramid", 1),
+            ("Python Django", 1),
+        ]
+        assert suggest("q=PY&limit=1") == [("PyTorch", 2)]
+        assert suggest("q=  python  d") == [("Python Django", 1)]
+        assert suggest("q=dja") == [("Python Django", 1)]
+        assert suggest("q=") == []
+        assert suggest("q=rust") == []
+
+        # Counts follow profile edits; skills nobody has are not suggested
+        carol_headers = auth_headers(carol)
+        client.put("/api/profile", json={"skills": ["Go"]}, headers=carol_headers)
+        assert suggest("q=pyt") == [("Python", 2), ("PyTorch", 1), ("Python Django", 1)]
+        client.put("/api/profile", json={"skills": ["Rust"]}, headers=carol_headers)
+        assert suggest("q=go") == []
+        assert suggest("q=ru") == [("Rust", 1)]
+
+        response = client.get("/api/skills/suggest?q=py&limit=0", headers=headers)
+        assert response.status_code == 400
+
+    def test_suggest_does_not_query_the_database(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        create_user("a@test.com", "mentor", "Alice", ["Python"])
+        client.get("/api/skills/suggest?q=p", headers=headers)
+
+        with count_queries() as statements:
+            response = client.get("/api/skills/suggest?q=py", headers=headers)
+        assert response.get_json() == [{"name": "Python", "mentors": 1}]
+        assert statements == []
+
+    def test_mentor_counts_follow_skill_edits(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        alice = create_user("a@test.com", "mentor", "Alice", ["Python", "AWS"])
+        create_user("b@test.com", "mentor", "Bob", ["python"])
+        alice_headers = auth_headers(alice)
+
+        def facets():
+            response = client.get("/api/skills", headers=headers)
+            assert response.status_code == 200
+            return [(f["name"], f["mentors"]) for f in response.get_json()]
+
+        assert facets() == [("Python", 2), ("AWS", 1)]
+
+        client.put(
+            "/api/profile", json={"skills": ["AWS", "Go"]}, headers=alice_headers
+        )
+        assert facets() == [("AWS", 1), ("Go", 1), ("Python", 1)]
+
+        client.put("/api/me", json={"skills": []}, headers=alice_headers)
+        assert facets() == [("Python", 1)]
+
+        with count_queries() as statements:
+            facets()
+        assert not any("GROUP BY" in statement for statement in statements)
+
+    def test_facets_alongside_mentor_list(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        create_user("a@test.com", "mentor", "Alice", ["Python", "AWS"])
+        create_user("b@test.com", "mentor", "Bob", ["python"])
+
+        response = client.get("/api/mentors?facets=true&skill=aws", headers=headers)
+        body = response.get_json()
+        assert [mentor["profile"]["name"] for mentor in body["mentors"]] == ["Alice"]
+        assert body["facets"] == [
+            {"name": "Python", "mentors": 2},
+            {"name": "AWS", "mentors": 1},
+        ]
+
+        # Without the flag the plain list is returned (and cached separately)
+        response = client.get("/api/mentors?skill=aws", headers=headers)
+        assert response.headers["X-Cache"] == "MISS"
+        assert isinstance(response.get_json(), list)
+
+    def test_reconcile_repairs_drifted_counts(self, client):
+        create_user("a@test.com", "mentor", "Alice", ["Python", "AWS"])
+        create_user("b@test.com", "mentor", "Bob", ["Python"])
+        with app.app_context():
+            db.session.execute(db.text("UPDATE skill SET mentor_count = 7"))
+            db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=["reconcile-skill-counts"])
+        assert "Corrected mentor counts for 2 skills" in result.output
+
+        with app.app_context():
+            counts = db.session.query(Skill.name, Skill.mentor_count).order_by(Skill.id)
+            assert counts.all() == [("Python", 2), ("AWS", 1)]
+            assert app_module.reconcile_skill_counts() == 0
+
+    def test_no_op_profile_save_writes_nothing(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        alice = create_user("a@test.com", "mentor", "Alice", ["Python", "AWS"])
+        alice_headers = auth_headers(alice)
+        client.get("/api/mentors", headers=headers)
+
+        for route in ("/api/profile", "/api/me"):
+            with count_queries() as statements:
+                response = client.put(
+                    route,
+                    json={"name": "Alice", "skills": ["python", " AWS"]},
+                    headers=alice_headers,
+                )
+            assert response.status_code == 200
+            writes = [
+                statement
+                for statement in statements
+                if statement.split()[0] in ("INSERT", "UPDATE", "DELETE")
+            ]
+            assert writes == []
+
+        response = client.get("/api/mentors", headers=headers)
+        assert response.headers["X-Cache"] == "HIT"
+
+    def test_skill_edits_only_touch_changed_rows(self, client):
+        alice = create_user("a@test.com", "mentor", "Alice", ["Python", "AWS", "Go"])
+        headers = auth_headers(alice)
+
+        def rows():
+            with app.app_context():
+                return [
+                    (row.id, row.skill.name)
+                    for row in MentorSkill.query.filter_by(user_id=alice)
+                    .order_by(MentorSkill.id)
+                ]
+
+        def save(skills):
+            with count_queries() as statements:
+                client.put("/api/profile", json={"skills": skills}, headers=headers)
+            writes = ("INSERT INTO mentor_skill", "DELETE FROM mentor_skill")
+            return [s.split()[0] for s in statements if s.startswith(writes)]
+
+        (python, _), (aws, _), (go, _) = rows()
+
+        # Appending inserts one row; dropping one from the middle deletes one
+        assert save(["Python", "AWS", "Go", "Rust"]).count("INSERT") == 1
+        assert save(["Python", "Go", "Rust"]) == ["DELETE"]
+        assert [row for row, _ in rows()][:2] == [python, go]
+
+        # Reordering rewrites rows from the first moved skill onwards
+        assert save(["Python", "Rust", "Go"]) == ["DELETE", "INSERT"]
+        assert [name for _, name in rows()] == ["Python", "Rust", "Go"]
+        assert rows()[0] == (python, "Python")
+
+        with app.app_context():
+            assert db.session.get(User, alice).skills_sort_key == "python, rust, go"
+        response = client.get("/api/profile", headers=headers)
+        assert response.get_json()["skills"] == ["Python", "Rust", "Go"]
+
+    def test_migration_links_existing_skills(self, legacy_db):
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    "INSERT INTO user (id, email, password_hash, role) "
+                    "VALUES (1, 'a@test.com', 'x', 'mentor'), "
+                    "(2, 'b@test.com', 'x', 'mentor')"
+                )
+                connection.exec_driver_sql(
+                    "INSERT INTO mentor_skill (user_id, skill) VALUES "
+                    "(1, 'React'), (1, ' python'), (1, 'react'), (2, 'Python ')"
+                )
+            migrate_database()
+
+            table = inspect(db.engine)
+            columns = [c["name"] for c in table.get_columns("mentor_skill")]
+            assert columns == ["id", "user_id", "skill_id"]
+            indexes = {i["name"] for i in table.get_indexes("mentor_skill")}
+            assert "ix_mentor_skill_skill_user" in indexes
+            assert "ix_mentor_skill_skill" not in indexes
+
+            skills = db.session.query(Skill.name, Skill.mentor_count).order_by(Skill.id)
+            assert skills.all() == [("React", 1), ("python", 2)]
+            mentors = User.query.order_by(User.id).all()
+            assert [[s.skill.name for s in m.mentor_skills] for m in mentors] == [
+                ["React", "python"],
+                ["python"],
+            ]
+            assert [m.skills_sort_key for m in mentors] == ["react, python", "python"]
+
+
+class TestMatchRequestFeeds:
+    """status filtering and cursor pagination on the match-request feeds"""
+
+    def _seed(self, feed="incoming"):
+        """15 requests to one mentor (incoming) or from one mentee (outgoing)"""
+        owner, other = ["mentor", "mentee"][:: 1 if feed == "incoming" else -1]
+        owner_id = create_user(f"{owner}@test.com", owner, "Owner")
+        other_ids = [create_user(f"{other}{i}@test.com", other, "M") for i in range(15)]
+        # At most one pending and one accepted request, as the schema allows
+        statuses = ["cancelled", "rejected", "cancelled", "rejected", "rejected"] * 3
+        statuses[0], statuses[-1] = "pending", "accepted"
+        with app.app_context():
+            for i, (status, other_id) in enumerate(zip(statuses, other_ids)):
+                ids = {owner: owner_id, other: other_id}
+                # Pairs of requests share a timestamp to exercise the id tie-break
+                created_at = datetime(2024, 1, 1) + timedelta(minutes=i // 2)
+                db.session.add(
+                    MatchingRequest(
+                        mentor_id=ids["mentor"],
+                        mentee_id=ids["mentee"],
+                        status=status,
+                        created_at=created_at,
+                    )
+                )
+            db.session.commit()
+        return owner_id
+
+    def _walk(self, client, url, headers):
+        ids, cursor = [], None
+        while True:
+            response = client.get(
+                url + (f"&cursor={cursor}" if cursor else ""), headers=headers
+            )
+            assert response.status_code == 200
+            ids.extend(item["id"] for item in response.get_json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return ids
+
+    @pytest.mark.parametrize("feed", ["incoming", "outgoing"])
+    def test_pages_are_newest_first_and_complete(self, client, feed):
+        headers = auth_headers(self._seed(feed))
+
+        url = f"/api/match-requests/{feed}?limit=4"
+        assert self._walk(client, url, headers) == list(range(15, 0, -1))
+
+        cancelled = self._walk(client, url + "&status=cancelled", headers)
+        assert cancelled == [13, 11, 8, 6, 3]
+
+        mixed = self._walk(client, url + "&status=accepted,pending", headers)
+        assert mixed == [15, 1]
+
+    @pytest.mark.parametrize(
+        "query", ["status=archived", "limit=0", "limit=2&cursor=WyJ4IiwxXQ"]
+    )
+    def test_bad_feed_parameters(self, client, query):
+        mentor_id = self._seed()
+        response = client.get(
+            f"/api/match-requests/incoming?{query}", headers=auth_headers(mentor_id)
+        )
+        assert response.status_code == 400
+
+    def test_pending_page_seeks_the_feed_index(self, client):
+        with app.app_context():
+            query = apply_keyset(
+                MatchingRequest.query.filter_by(mentor_id=1, status="pending"),
+                MatchingRequest.created_at,
+                MatchingRequest.id,
+                True,
+                [datetime(2024, 1, 1), 50],
+            )
+            plan = query_plan(query.limit(21))
+        assert "ix_matching_request_mentor_feed" in plan, plan
+        assert "created_at<?" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+
+class TestOpenAPICache:
+    """/openapi.json and /openapi.yaml are parsed once and served with ETags"""
+
+    @pytest.fixture
+    def spec_path(self, tmp_path):
+        path = tmp_path / "openapi.yaml"
+        path.write_text("openapi: 3.0.1\ninfo:\n  title: Cached\n  version: '1'\n")
+        original = app.config["OPENAPI_SPEC_PATH"]
+        app.config["OPENAPI_SPEC_PATH"] = str(path)
+        yield path
+        app.config["OPENAPI_SPEC_PATH"] = original
+
+    def test_spec_is_parsed_once(self, client, spec_path, monkeypatch):
+        calls = []
+        safe_load = yaml.safe_load
+        monkeypatch.setattr(
+            yaml, "safe_load", lambda data: calls.append(1) or safe_load(data)
+        )
+
+        for _ in range(3):
+            response = client.get("/openapi.json")
+            assert response.get_json()["info"]["title"] == "Cached"
+        assert len(calls) == 1
+
+    def test_conditional_and_compressed_responses(self, client, spec_path):
+        response = client.get("/openapi.json")
+        etag = response.headers["ETag"]
+        assert response.status_code == 200
+        assert "Content-Encoding" not in response.headers
+
+        response = client.get("/openapi.json", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+
+        response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["ETag"] != etag
+        assert "Accept-Encoding" in response.headers.get_all("Vary")
+        assert json.loads(gzip.decompress(response.data))["info"]["title"] == "Cached"
+
+        response = client.get("/openapi.yaml")
+        assert response.status_code == 200
+        assert response.data == spec_path.read_bytes()
+        response = client.get(
+            "/openapi.yaml", headers={"If-None-Match": response.headers["ETag"]}
+        )
+        assert response.status_code == 304
+
+    def test_cache_follows_file_changes(self, client, spec_path):
+        etag = client.get("/openapi.json").headers["ETag"]
+
+        spec_path.write_text("openapi: 3.0.1\ninfo:\n  title: Edited\n  version: '2'\n")
+        stat = spec_path.stat()
+        os.utime(spec_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        response = client.get("/openapi.json", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.get_json()["info"]["title"] == "Edited"
+
+        # A file that doesn't parse is still served as written
+        spec_path.write_text("openapi: [unclosed\n")
+        os.utime(spec_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+        response = client.get("/openapi.yaml")
+        assert response.status_code == 200
+        assert response.data == spec_path.read_bytes()
+        assert client.get("/openapi.json").get_json()["paths"] == {}
+
+        spec_path.unlink()
+        assert client.get("/openapi.yaml").status_code == 404
+        assert client.get("/openapi.json").get_json()["paths"] == {}
+
+
+class TestPasswordHashing:
+    """Password hashing runs on a bounded pool and upgrades old hashes"""
+
+    @pytest.fixture
+    def hashing_config(self):
+        keys = [
+            "PASSWORD_HASH_METHOD",
+            "PASSWORD_HASH_EXECUTOR",
+            "PASSWORD_HASH_WORKERS",
+            "PASSWORD_HASH_QUEUE_SIZE",
+        ]
+        original = {key: app.config[key] for key in keys}
+        shutdown_password_hasher()
+        yield app.config
+        shutdown_password_hasher()
+        app.config.update(original)
+
+    def _login(self, client):
+        return client.post(
+            "/api/login", json={"email": "m@test.com", "password": "password123"}
+        )
+
+    def test_login_rehashes_when_parameters_change(self, client, hashing_config):
+        user_id = create_user("m@test.com", "mentor", "Mentor")
+        hashing_config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:2000"
+
+        assert self._login(client).status_code == 200
+        with app.app_context():
+            stored = db.session.get(User, user_id).password_hash
+        assert stored.startswith("pbkdf2:sha256:2000$")
+
+        # Already current: the hash is left alone
+        assert self._login(client).status_code == 200
+        with app.app_context():
+            assert db.session.get(User, user_id).password_hash == stored
+
+    def test_default_method_keeps_existing_hashes(self):
+        # Hashes made before the hashing pool used werkzeug's default method
+        assert not app_module.password_needs_rehash(generate_password_hash("pw"))
+
+    @pytest.mark.parametrize(
+        "method", ["pbkdf2", "pbkdf2:sha512", "pbkdf2:sha256:2000", "scrypt"]
+    )
+    def test_rehash_check_does_no_hashing(self, hashing_config, monkeypatch, method):
+        stored = generate_password_hash("password123", method)
+        hashing_config["PASSWORD_HASH_METHOD"] = method
+        monkeypatch.setattr(app_module, "generate_password_hash", None)
+
+        assert not app_module.password_needs_rehash(stored)
+        hashing_config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:3000"
+        assert app_module.password_needs_rehash(stored)
+
+    @pytest.mark.parametrize("executor", ["thread", "process"])
+    def test_saturated_pool_sheds_load(self, client, hashing_config, executor):
+        create_user("m@test.com", "mentor", "Mentor")
+        hashing_config.update(
+            PASSWORD_HASH_EXECUTOR=executor,
+            PASSWORD_HASH_WORKERS=1,
+            PASSWORD_HASH_QUEUE_SIZE=0,
+            PASSWORD_HASH_METHOD="pbkdf2:sha256:1000",
+        )
+        assert self._login(client).status_code == 200
+
+        # Occupy the only slot for half a second
+        blocker = threading.Thread(target=run_hashing_job, args=(time.sleep, 0.5))
+        blocker.start()
+        time.sleep(0.1)
+        try:
+            response = self._login(client)
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "1"
+        finally:
+            blocker.join()
+
+        assert self._login(client).status_code == 200
+
+
+class TestClaimsAuthorization:
+    """Role checks use the token's claims instead of a user lookup"""
+
+    @pytest.fixture
+    def pair(self, client):
+        mentor_id = create_user("mentor@test.com", "mentor", "Mentor")
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        with app.app_context():
+            request = MatchingRequest(mentor_id=mentor_id, mentee_id=mentee_id)
+            db.session.add(request)
+            db.session.commit()
+            request_id = request.id
+        return auth_headers(mentor_id), auth_headers(mentee_id), request_id
+
+    def test_role_check_saves_a_query(self, client, pair):
+        mentor_headers, mentee_headers, _ = pair
+
+        with count_queries() as from_claims:
+            response = client.get(
+                "/api/match-requests/incoming", headers=mentor_headers
+            )
+        assert response.status_code == 200
+        assert len(from_claims) == 1
+
+        app.config["AUTHORIZE_FROM_CLAIMS"] = False
+        try:
+            with count_queries() as from_database:
+                client.get("/api/match-requests/incoming", headers=mentor_headers)
+        finally:
+            app.config["AUTHORIZE_FROM_CLAIMS"] = True
+        assert len(from_database) == len(from_claims) + 1
+
+        # The claim is still enforced
+        response = client.get("/api/match-requests/incoming", headers=mentee_headers)
+        assert response.status_code == 403
+
+    def test_mentor_and_mentee_actions(self, client, pair):
+        mentor_headers, mentee_headers, request_id = pair
+
+        response = client.put(
+            f"/api/match-requests/{request_id}/reject", headers=mentor_headers
+        )
+        assert response.get_json()["status"] == "rejected"
+
+        response = client.delete(
+            f"/api/match-requests/{request_id}", headers=mentee_headers
+        )
+        assert response.get_json()["status"] == "cancelled"
+
+        response = client.put(
+            f"/api/match-requests/{request_id}/accept", headers=mentee_headers
+        )
+        assert response.status_code == 403
+
+    def test_revoked_tokens_are_rejected(self, client, pair):
+        mentor_headers, _, _ = pair
+        with app.app_context():
+            mentor_id = User.query.filter_by(role="mentor").one().id
+
+        time.sleep(1)  # iat has one-second resolution
+        revoke_user_tokens(mentor_id)
+        response = client.get("/api/match-requests/incoming", headers=mentor_headers)
+        assert response.status_code == 401
+
+        # A token issued in the same second as the revocation is still good
+        response = client.get(
+            "/api/match-requests/incoming", headers=auth_headers(mentor_id)
+        )
+        assert response.status_code == 200
+
+
+def _accept_in_subprocess(request_id, headers, barrier, results):
+    """Worker for the multi-process accept test (runs in a forked child)"""
+    with app.app_context():
+        db.engine.dispose(close=False)  # don't share the parent's connections
+    with app.test_client() as client:
+        barrier.wait()
+        response = client.put(
+            f"/api/match-requests/{request_id}/accept", headers=headers
+        )
+    results.put(response.status_code)
+
+
+class TestRequestStatusRules:
+    """One pending request per mentee and one accepted per mentor, atomically"""
+
+    @pytest.fixture
+    def requests_to_mentor(self, client):
+        """One mentor with a pending request from each of 8 mentees"""
+        mentor_id = create_user("mentor@test.com", "mentor", "Mentor")
+        request_ids = []
+        with app.app_context():
+            for i in range(8):
+                mentee_id = create_user(f"e{i}@test.com", "mentee", f"Mentee {i}")
+                request = MatchingRequest(mentor_id=mentor_id, mentee_id=mentee_id)
+                db.session.add(request)
+                db.session.commit()
+                request_ids.append(request.id)
+        return mentor_id, request_ids
+
+    def _accepted(self, mentor_id):
+        with app.app_context():
+            return MatchingRequest.query.filter_by(
+                mentor_id=mentor_id, status="accepted"
+            ).count()
+
+    def test_accept_is_a_single_conditional_update(self, client, requests_to_mentor):
+        mentor_id, (first, second, third, *_) = requests_to_mentor
+        headers = auth_headers(mentor_id)
+
+        with count_queries() as statements:
+            response = client.put(
+                f"/api/match-requests/{first}/accept", headers=headers
+            )
+        assert response.status_code == 200
+        assert response.get_json()["status"] == "accepted"
+        assert [s.split()[0] for s in statements] == ["UPDATE"]
+
+        for url, body in [
+            (f"/api/match-requests/{second}/accept", None),
+            (f"/api/match-requests/{first}/accept", None),
+            (f"/api/requests/{second}", {"status": "accepted"}),
+        ]:
+            response = client.put(url, json=body, headers=headers)
+            assert response.status_code == 400
+            assert "already have an accepted" in response.get_json()["error"]
+
+        other_headers = auth_headers(create_user("m2@test.com", "mentor", "Other"))
+        for url, body, status in [
+            ("/api/match-requests/999/accept", None, 404),
+            (f"/api/match-requests/{third}/accept", None, 403),
+            (f"/api/match-requests/{third}/reject", None, 403),
+            ("/api/requests/999", {"status": "rejected"}, 404),
+            (f"/api/requests/{third}", {"status": "rejected"}, 403),
+        ]:
+            response = client.put(url, json=body, headers=other_headers)
+            assert response.status_code == status
+
+        response = client.put(
+            f"/api/requests/{third}", json={"status": "maybe"}, headers=headers
+        )
+        assert response.status_code == 400
+        response = client.put(
+            f"/api/requests/{third}", json={"status": "rejected"}, headers=headers
+        )
+        assert response.status_code == 200
+        assert self._accepted(mentor_id) == 1
+
+    def test_second_pending_request_violates_the_index(self, client):
+        mentee_id = create_user("e@test.com", "mentee", "Mentee")
+        mentor_ids = [create_user(f"m{i}@test.com", "mentor", "M") for i in range(2)]
+        with app.app_context():
+            for mentor_id in mentor_ids:
+                db.session.add(
+                    MatchingRequest(mentor_id=mentor_id, mentee_id=mentee_id)
+                )
+            with pytest.raises(IntegrityError):
+                db.session.commit()
+
+    @staticmethod
+    def _require_file_database():
+        # match_request_tdd_test.py switches the suite to one shared in-memory
+        # connection, which can't exercise concurrent writers
+        with app.app_context():
+            if db.engine.url.database in (None, "", ":memory:"):
+                pytest.skip("concurrency tests need a file-backed database")
+
+    def test_parallel_accepts_from_threads(self, client, requests_to_mentor):
+        self._require_file_database()
+        mentor_id, request_ids = requests_to_mentor
+        headers = auth_headers(mentor_id)
+        barrier = threading.Barrier(len(request_ids))
+        results = []
+
+        def accept(request_id):
+            with app.test_client() as thread_client:
+                barrier.wait()
+                response = thread_client.put(
+                    f"/api/match-requests/{request_id}/accept", headers=headers
+                )
+            results.append(response.status_code)
+
+        threads = [threading.Thread(target=accept, args=(i,)) for i in request_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(results) == [200] + [400] * (len(request_ids) - 1)
+        assert self._accepted(mentor_id) == 1
+
+    def test_parallel_accepts_from_processes(self, client, requests_to_mentor):
+        self._require_file_database()
+        mentor_id, request_ids = requests_to_mentor
+        headers = auth_headers(mentor_id)
+        context = multiprocessing.get_context("fork")
+        barrier = context.Barrier(len(request_ids))
+        results = context.Queue()
+
+        workers = [
+            context.Process(
+                target=_accept_in_subprocess,
+                args=(request_id, headers, barrier, results),
+            )
+            for request_id in request_ids
+        ]
+        for worker in workers:
+            worker.start()
+        statuses = sorted(results.get(timeout=30) for _ in workers)
+        for worker in workers:
+            worker.join()
+
+        assert statuses == [200] + [400] * (len(request_ids) - 1)
+        assert self._accepted(mentor_id) == 1
+
+    def test_migration_resolves_existing_duplicates(self, legacy_db):
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    "INSERT INTO user (id, email, password_hash, role) VALUES "
+                    "(1, 'm@test.com', 'x', 'mentor'), "
+                    "(2, 'a@test.com', 'x', 'mentee'), "
+                    "(3, 'b@test.com', 'x', 'mentee'), "
+                    "(4, 'n@test.com', 'x', 'mentor'), "
+                    "(5, 'o@test.com', 'x', 'mentor')"
+                )
+                connection.exec_driver_sql(
+                    "INSERT INTO matching_request "
+                    "(id, mentor_id, mentee_id, status, created_at, updated_at) VALUES "
+                    "(1, 1, 2, 'accepted', '2024-01-01', '2024-01-03'), "
+                    "(2, 1, 3, 'accepted', '2024-01-01', '2024-01-02'), "
+                    "(3, 4, 2, 'pending', '2024-01-05', '2024-01-05'), "
+                    "(4, 5, 2, 'pending', '2024-01-04', '2024-01-04')"
+                )
+            migrate_database()
+
+            statuses = db.session.query(MatchingRequest.id, MatchingRequest.status)
+            assert statuses.order_by(MatchingRequest.id).all() == [
+                (1, "rejected"),
+                (2, "accepted"),
+                (3, "cancelled"),
+                (4, "pending"),
+            ]
+            indexes = {
+                index["name"]: index["unique"]
+                for index in inspect(db.engine).get_indexes("matching_request")
+            }
+            assert indexes["uq_matching_request_accepted_mentor"]
+            assert indexes["uq_matching_request_pending_mentee"]
+            assert "ix_matching_request_accepted_mentor" not in indexes
+
+
+class TestRequestCreation:
+    """Creating a request is one guarded INSERT; unique indexes do the checks"""
+
+    def test_create_is_a_single_insert(self, client):
+        mentor_id = create_user("mentor@test.com", "mentor", "Mentor")
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        headers = auth_headers(mentee_id)
+
+        with count_queries() as statements:
+            response = client.post(
+                "/api/match-requests",
+                json={"mentorId": mentor_id, "message": "Hi"},
+                headers=headers,
+            )
+        assert response.status_code == 200
+        assert response.get_json() == {
+            "id": 1,
+            "mentorId": mentor_id,
+            "menteeId": mentee_id,
+            "message": "Hi",
+            "status": "pending",
+        }
+        assert [s.split()[0] for s in statements] == ["INSERT"]
+
+    @pytest.mark.parametrize(
+        "url, not_found", [("/api/match-requests", 400), ("/api/requests", 404)]
+    )
+    def test_violations_keep_their_errors(self, client, url, not_found):
+        mentor_ids = [create_user(f"m{i}@test.com", "mentor", "M") for i in range(2)]
+        mentee_id = create_user("mentee@test.com", "mentee", "Mentee")
+        headers = auth_headers(mentee_id)
+
+        def send(mentor_id):
+            return client.post(url, json={"mentorId": mentor_id}, headers=headers)
+
+        assert send(mentor_ids[0]).status_code in (200, 201)
+        for mentor_id, status, error in [
+            (mentor_ids[0], 400, "You already have a pending request"),
+            (mentor_ids[1], 400, "You already have a pending request"),
+            (mentee_id, not_found, "Mentor not found"),
+            (999, not_found, "Mentor not found"),
+        ]:
+            response = send(mentor_id)
+            assert response.status_code == status
+            assert response.get_json()["error"] == error
+
+        with app.app_context():
+            MatchingRequest.query.update({"status": "rejected"})
+            db.session.commit()
+        response = send(mentor_ids[0])
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Request to this mentor already exists"
+        assert send(mentor_ids[1]).status_code in (200, 201)
+
+        with app.app_context():
+            assert MatchingRequest.query.count() == 2
+
+    def test_migration_archives_duplicate_pairs(self, legacy_db):
+        with app.app_context():
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    "INSERT INTO user (id, email, password_hash, role) VALUES "
+                    "(1, 'm@test.com', 'x', 'mentor'), "
+                    "(2, 'a@test.com', 'x', 'mentee'), "
+                    "(3, 'b@test.com', 'x', 'mentee')"
+                )
+                connection.exec_driver_sql(
+                    "INSERT INTO matching_request "
+                    "(id, mentor_id, mentee_id, status, created_at, updated_at) VALUES "
+                    "(1, 1, 2, 'rejected', '2024-01-01', '2024-01-01'), "
+                    "(2, 1, 2, 'accepted', '2024-01-02', '2024-01-02'), "
+                    "(3, 1, 2, 'cancelled', '2024-01-03', '2024-01-03'), "
+                    "(4, 1, 3, 'rejected', '2024-01-01', '2024-01-01'), "
+                    "(5, 1, 3, 'cancelled', '2024-01-02', '2024-01-02')"
+                )
+            migrate_database()
+
+            remaining = db.session.query(MatchingRequest.id, MatchingRequest.status)
+            assert remaining.order_by(MatchingRequest.id).all() == [
+                (2, "accepted"),
+                (5, "cancelled"),
+            ]
+            archived = db.session.execute(
+                db.text("SELECT id, status FROM matching_request_archive ORDER BY id")
+            )
+            assert archived.all() == [
+                (1, "rejected"),
+                (3, "cancelled"),
+                (4, "rejected"),
+            ]
+            indexes = {
+                index["name"]: index["unique"]
+                for index in inspect(db.engine).get_indexes("matching_request")
+            }
+            assert indexes["uq_matching_request_mentor_mentee"]
+            assert "ix_matching_request_mentor_mentee" not in indexes
+
+
+class TestSignupEmailValidation:
+    """Signup validates syntax offline; DNS checks are optional and cached"""
+
+    @pytest.fixture
+    def dns(self, monkeypatch):
+        """Fake DNS: domains starting with "bad" do not exist"""
+        lookups = []
+
+        def fake_deliverability(domain, domain_i18n, timeout=None):
+            lookups.append(domain)
+            if domain.startswith("bad"):
+                raise app_module.EmailUndeliverableError("no such domain")
+            return {"mx": [(10, f"mail.{domain}")]}
+
+        monkeypatch.setattr(
+            app_module, "validate_email_deliverability", fake_deliverability
+        )
+        app_module._email_domain_cache.clear()
+        yield lookups
+        app.config["EMAIL_DELIVERABILITY_CHECK"] = "off"
+        app_module._email_domain_cache.clear()
+
+    def _signup(self, client, email):
+        return client.post(
+            "/api/signup",
+            json={"email": email, "password": "pw", "name": "N", "role": "mentee"},
+        )
+
+    def test_default_mode_does_no_dns(self, client, dns):
+        assert self._signup(client, "a@bad-domain.com").status_code == 201
+        assert self._signup(client, "not-an-email").status_code == 400
+        assert dns == []
+
+    def test_sync_mode_caches_per_domain(self, client, dns):
+        app.config["EMAIL_DELIVERABILITY_CHECK"] = "sync"
+
+        assert self._signup(client, "a@bad-domain.com").status_code == 400
+        assert self._signup(client, "b@bad-domain.com").status_code == 400
+        assert self._signup(client, "a@good.com").status_code == 201
+        assert self._signup(client, "b@GOOD.com").status_code == 201
+        assert dns == ["bad-domain.com", "good.com"]
+
+    def test_async_mode_rejects_once_verdict_is_known(self, client, dns):
+        app.config["EMAIL_DELIVERABILITY_CHECK"] = "async"
+
+        # Not known yet: accepted while the check runs in the background
+        assert self._signup(client, "a@bad-domain.com").status_code == 201
+        deadline = time.monotonic() + 5
+        while app_module.cached_domain_deliverability("bad-domain.com") is None:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+        assert self._signup(client, "b@bad-domain.com").status_code == 400
+        assert dns == ["bad-domain.com"]
+
+    @pytest.mark.parametrize(
+        "error, status, cached",
+        [
+            (app_module.dns.resolver.NXDOMAIN(), 400, False),
+            (ConnectionResetError("network down"), 201, None),
+            (RuntimeError("resolver bug"), 201, None),
+        ],
+    )
+    def test_only_definite_answers_are_cached(
+        self, client, monkeypatch, error, status, cached
+    ):
+        class Resolver:
+            def resolve(self, domain, record_type):
+                raise error
+
+        # Runs email_validator's real lookup against a failing resolver
+        monkeypatch.setattr(
+            app_module.dns.resolver, "get_default_resolver", lambda: Resolver()
+        )
+        monkeypatch.setitem(app.config, "EMAIL_DELIVERABILITY_CHECK", "sync")
+        app_module._email_domain_cache.clear()
+
+        assert self._signup(client, "a@example.com").status_code == status
+        assert app_module.cached_domain_deliverability("example.com") is cached
+        app_module._email_domain_cache.clear()
+
+
+class TestMentorDirectoryCache:
+    """GET /api/mentors responses are cached until a mentor changes"""
+
+    def test_hits_until_a_mentor_profile_changes(self, client):
+        mentee_id = create_user("e@test.com", "mentee", "Mentee")
+        mentor_id = create_user("m@test.com", "mentor", "Alice", ["Go"])
+        mentee_headers = auth_headers(mentee_id)
+        mentor_headers = auth_headers(mentor_id)
+
+        response = client.get("/api/mentors", headers=mentee_headers)
+        assert response.headers["X-Cache"] == "MISS"
+        with count_queries() as statements:
+            response = client.get("/api/mentors", headers=mentee_headers)
+        assert response.headers["X-Cache"] == "HIT"
+        assert statements == []
+
+        # Different parameters are cached separately
+        response = client.get("/api/mentors?sortOrder=desc", headers=mentee_headers)
+        assert response.headers["X-Cache"] == "MISS"
+
+        # Mentee profile changes don't touch the directory
+        client.put("/api/profile", json={"bio": "Hi"}, headers=mentee_headers)
+        response = client.get("/api/mentors", headers=mentee_headers)
+        assert response.headers["X-Cache"] == "HIT"
+
+        client.put("/api/profile", json={"bio": "Gopher"}, headers=mentor_headers)
+        response = client.get("/api/mentors", headers=mentee_headers)
+        assert response.headers["X-Cache"] == "MISS"
+        assert response.get_json()[0]["profile"]["bio"] == "Gopher"
+
+        client.post(
+            "/api/signup",
+            json={
+                "email": "b@x.com",
+                "password": "pw",
+                "name": "Bob",
+                "role": "mentor",
+            },
+        )
+        response = client.get("/api/mentors", headers=mentee_headers)
+        assert response.headers["X-Cache"] == "MISS"
+        assert len(response.get_json()) == 2
+
+    def test_errors_are_not_cached(self, client):
+        headers = auth_headers(create_user("e@test.com", "mentee", "Mentee"))
+        for _ in range(2):
+            response = client.get("/api/mentors?limit=0", headers=headers)
+            assert response.status_code == 400
+        assert mentor_directory_cache.stats()["entries"] == 0
+
+    def test_lru_eviction_by_entries_and_bytes(self):
+        cache = ResponseCache("MENTOR_CACHE_MAX_ENTRIES", "MENTOR_CACHE_MAX_BYTES")
+        original = dict(app.config)
+        app.config.update(MENTOR_CACHE_MAX_ENTRIES=2, MENTOR_CACHE_MAX_BYTES=10)
+        try:
+            cache.get_or_compute("a", lambda: (b"1111", None))
+            cache.get_or_compute("b", lambda: (b"2222", None))
+            cache.get_or_compute("a", lambda: (b"xxxx", None))  # a is now newest
+            cache.get_or_compute("c", lambda: (b"3333", None))  # evicts b
+            assert cache.get_or_compute("a", lambda: (b"xxxx", None)) == (
+                (b"1111", None),
+                True,
+            )
+            assert cache.get_or_compute("b", lambda: (b"2222", None))[1] is False
+
+            cache.get_or_compute("big", lambda: (b"x" * 11, None))  # never stored
+            stats = cache.stats()
+            assert stats["entries"] == 2 and stats["bytes"] <= 10
+            assert stats["evictions"] == 2
+        finally:
+            app.config.update(original)
+
+    def test_concurrent_misses_compute_once(self):
+        cache = ResponseCache("MENTOR_CACHE_MAX_ENTRIES", "MENTOR_CACHE_MAX_BYTES")
+        calls = []
+        release = threading.Event()
+
+        def slow_compute():
+            calls.append(1)
+            release.wait(5)
+            return b"[]", None
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get_or_compute("k", slow_compute))
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert [hit for _, hit in results].count(False) == 1
+        assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 7
+
+    def test_invalidation_discards_in_flight_results(self):
+        cache = ResponseCache("MENTOR_CACHE_MAX_ENTRIES", "MENTOR_CACHE_MAX_BYTES")
+
+        def compute_then_invalidate():
+            cache.invalidate()  # a write lands while we were reading
+            return b"stale", None
+
+        assert cache.get_or_compute("k", compute_then_invalidate)[1] is False
+        assert cache.get_or_compute("k", lambda: (b"fresh", None)) == (
+            (b"fresh", None),
+            False,
+        )
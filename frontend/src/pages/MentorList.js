@@ -1,16 +1,22 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import { useAuth } from '../context/AuthContext';
+import { thumbnailUrl } from '../utils/thumbnailUrl';
+
+const PAGE_SIZE = 20;
 
 function MentorList() {
   const [mentors, setMentors] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
   const [filters, setFilters] = useState({
     skill: '',
     sortBy: 'name',
     sortOrder: 'asc'
   });
+  const [suggestions, setSuggestions] = useState([]);
   const [selectedMentor, setSelectedMentor] = useState(null);
   const [requestMessage, setRequestMessage] = useState('');
   const [submitting, setSubmitting] = useState(false);
@@ -21,19 +27,47 @@ function MentorList() {
     fetchMentors();
   }, [filters]);
 
-  const fetchMentors = async () => {
+  useEffect(() => {
+    // Only the last comma-separated entry is being typed
+    const typed = filters.skill.split(',').pop().trim();
+    if (!typed) {
+      setSuggestions([]);
+      return;
+    }
+    let cancelled = false;
+    axios
+      .get('/api/skills/suggest', { params: { q: typed } })
+      .then((response) => {
+        if (!cancelled) setSuggestions(response.data);
+      })
+      .catch(() => {
+        if (!cancelled) setSuggestions([]);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [filters.skill]);
+
+  const fetchMentors = async (cursor = null) => {
     try {
-      setLoading(true);
+      if (cursor) {
+        setLoadingMore(true);
+      } else {
+        setLoading(true);
+      }
       setError('');
       const params = new URLSearchParams();
       if (filters.skill) params.append('skill', filters.skill);
       if (filters.sortBy) params.append('sortBy', filters.sortBy);
       if (filters.sortOrder) params.append('sortOrder', filters.sortOrder);
+      params.append('limit', PAGE_SIZE);
+      if (cursor) params.append('cursor', cursor);
 
       console.log('Fetching mentors with params:', params.toString());
       const response = await axios.get(`/api/mentors?${params}`);
       console.log('Mentors response:', response.data);
-      setMentors(response.data);
+      setMentors(cursor ? [...mentors, ...response.data] : response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (err) {
       console.error('Error fetching mentors:', err);
       if (err.response) {
@@ -49,6 +83,7 @@ function MentorList() {
       }
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -103,7 +138,22 @@ function MentorList() {
               value={filters.skill}
               onChange={handleFilterChange}
               placeholder="Enter skill name"
+              list="skill-suggestions"
+              autoComplete="off"
             />
+            <datalist id="skill-suggestions">
+              {suggestions.map((suggestion) => (
+                <option
+                  key={suggestion.name}
+                  value={[
+                    ...filters.skill.split(',').slice(0, -1).map((s) => s.trim()),
+                    suggestion.name
+                  ].join(', ')}
+                >
+                  {suggestion.mentors} mentors
+                </option>
+              ))}
+            </datalist>
           </div>
           
           <div className="filter-group">
@@ -147,7 +197,8 @@ function MentorList() {
           {mentors.map((mentor) => (
             <div key={mentor.id} className="mentor-card">
               <img
-                src={mentor.profile.imageUrl}
+                src={thumbnailUrl(mentor.profile.imageUrl, 128)}
+                srcSet={`${thumbnailUrl(mentor.profile.imageUrl, 256)} 2x`}
                 alt={mentor.profile.name}
                 className="profile-image"
               />
@@ -170,6 +221,18 @@ function MentorList() {
         </div>
       )}
 
+      {!loading && nextCursor && (
+        <div style={{ textAlign: 'center', marginTop: '20px' }}>
+          <button
+            onClick={() => fetchMentors(nextCursor)}
+            className="btn btn-secondary"
+            disabled={loadingMore}
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
+
       {/* Request Modal */}
       {selectedMentor && (
         <div className="modal-overlay">
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import { useAuth } from '../context/AuthContext';
+import { thumbnailUrl } from '../utils/thumbnailUrl';
 
 function Requests() {
   const [requests, setRequests] = useState([]);
@@ -103,7 +104,8 @@ function Requests() {
                     // Mentor view - show mentee info
                     <div style={{ display: 'flex', alignItems: 'center', marginBottom: '15px' }}>
                       <img
-                        src={request.mentee.imageUrl}
+                        src={thumbnailUrl(request.mentee.imageUrl, 64)}
+                        srcSet={`${thumbnailUrl(request.mentee.imageUrl, 128)} 2x`}
                         alt={request.mentee.name}
                         className="profile-image"
                         style={{ width: '60px', height: '60px', marginRight: '15px' }}
@@ -117,7 +119,8 @@ function Requests() {
                     // Mentee view - show mentor info
                     <div style={{ display: 'flex', alignItems: 'center', marginBottom: '15px' }}>
                       <img
-                        src={request.mentor.imageUrl}
+                        src={thumbnailUrl(request.mentor.imageUrl, 64)}
+                        srcSet={`${thumbnailUrl(request.mentor.imageUrl, 128)} 2x`}
                         alt={request.mentor.name}
                         className="profile-image"
                         style={{ width: '60px', height: '60px', marginRight: '15px' }}
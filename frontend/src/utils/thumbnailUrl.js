@@ -0,0 +1,6 @@
+// imageUrl with a ?size= thumbnail (64, 128 or 256 px), so lists of
+// avatars don't download full-size uploads
+export function thumbnailUrl(imageUrl, size) {
+  const separator = imageUrl.includes('?') ? '&' : '?';
+  return `${imageUrl}${separator}size=${size}`;
+}